@@ -0,0 +1,168 @@
+import constants as c
+import pandas as pd
+from openpyxl.comments import Comment
+from openpyxl.utils import column_index_from_string
+from file_handler import widen_floats
+from local_backend import item_name
+from local_backend import item_sort_key
+
+# Keyed pandas equivalents of the SUMIFS formulas of the Summary sheet (SUMMARY_FORMULA_MODE 'values' / 'both')
+# and of the VLOOKUP formulas of the TPR Inventory sheet (TPR_FORMULA_MODE 'values' / 'both').
+
+def key_text(values):
+    """
+    Returns the lookup keys of a column the way SUMIFS compares text (case-insensitive), blanks become NaN.
+    """
+    text = values.astype(str)
+    return text.str.casefold().where(values.notna() & (text != ''))
+
+def match_criteria(values, criteria):
+    """
+    Evaluates a SUMIFS text criteria such as '<>Job: MRP*' or '=Job: MRP*' on a column
+    (case-insensitive, '*' wildcard at the end of the pattern).
+    """
+    negate = criteria.startswith('<>')
+    pattern = criteria[2:] if negate else criteria.lstrip('=')
+    text = values.astype(str).str.casefold().where(values.notna(), '')
+
+    if pattern.endswith('*'):
+        hits = text.str.startswith(pattern[:-1].casefold())
+    else:
+        hits = text == pattern.casefold()
+    return ~hits if negate else hits
+
+def sumifs_totals(detail_df, sum_col, key_col='A', criteria_col=None, criteria=None):
+    """
+    Computes SUMIFS(sum_col, key_col, key, criteria_col, criteria) for every key of the detail sheet with one groupby.
+
+    Parameters:
+    - detail_df: frame of the detail sheet (MO, PO, SO, Forecast, Suggestion)
+    - sum_col / key_col / criteria_col: column letters of the detail sheet
+    - criteria: SUMIFS criteria applied on criteria_col
+
+    Returns:
+    - Series: totals indexed by lookup key
+    """
+    amounts = widen_floats(pd.to_numeric(detail_df.iloc[:, column_index_from_string(sum_col) - 1], errors='coerce')) # text is ignored like SUMIFS
+    if criteria_col:
+        amounts = amounts.where(match_criteria(detail_df.iloc[:, column_index_from_string(criteria_col) - 1], criteria))
+
+    return amounts.groupby(key_text(detail_df.iloc[:, column_index_from_string(key_col) - 1])).sum()
+
+def summary_totals(frames, totals=None):
+    """
+    Computes the SUMIFS totals of every summary_aggregations column, keyed by column index. When totals of earlier
+    source chunks are given, the totals of these frames are added to them (chunked streaming mode).
+    """
+    totals = dict(totals or {})
+    for col_index_str, (sheet_name, sum_col, criteria_col, criteria) in c.summary_aggregations.items():
+        chunk_totals = sumifs_totals(frames[sheet_name], sum_col, criteria_col=criteria_col, criteria=criteria)
+        col_index = int(col_index_str)
+        totals[col_index] = totals[col_index].add(chunk_totals, fill_value=0) if col_index in totals else chunk_totals
+    return totals
+
+def compute_summary_values(ohs_df, frames, totals=None):
+    """
+    Computes the values of the Summary formula columns (formula_map_summary) for every Summary row.
+
+    Parameters:
+    - ohs_df: OHS frame, the Summary rows are copied from it (column A part, column P on-hand stock)
+    - frames: partitioned frames keyed by sheet name
+    - totals: summary_totals accumulated over all source chunks, used instead of frames
+
+    Returns:
+    - DataFrame: one column per formula_map_summary column index, aligned with the Summary rows
+    """
+    keys = key_text(ohs_df.iloc[:, c.COLUMNS_TO_COPY_SUMMARY[0] - 1])
+    on_hand = widen_floats(pd.to_numeric(ohs_df.iloc[:, c.COLUMNS_TO_COPY_SUMMARY[-1] - 1], errors='coerce')).fillna(0) # Column H (On-hand Stock)
+
+    values = pd.DataFrame(index=ohs_df.index)
+    for col_index, col_totals in (totals or summary_totals(frames)).items():
+        values[col_index] = keys.map(col_totals).fillna(0).to_numpy()
+
+    I, J, K, L, M, P, Q, R = (values[idx] for idx in (9, 10, 11, 12, 13, 16, 17, 18))
+    values[14] = on_hand + I + J - K - L - M # Column N (Available)
+    values[15] = values[14] + P + R - Q # Column O (Available with MRP)
+    values[20] = K + M + L + Q # Column T (Demand)
+    values[21] = on_hand + J # Column U (Supply)
+    values[22] = values[21] - values[20] # Column V
+    values[23] = (values[15] > 0).map({True: True, False: 0}) # Column W
+    values[24] = (R > 0).map({True: True, False: None}) # Column X
+    values[25] = values[23].astype(object) == values[24].astype(object) # Column Y
+
+    print(f"Summary values computed for {len(values)} rows.")
+    return values[sorted(values.columns)]
+
+def tpr_area_table(inventory_df, row_field='Part Num', column_field='Area', data_field='On Hand'):
+    """
+    Aggregates the QOH data part -> Area, laid out like the 'Inventory by WH' pivot the TPR Inventory VLOOKUPs read
+    (visible Areas in pivot order, then Grand Total).
+
+    Returns:
+    - tuple: (visible Area labels, DataFrame indexed by lookup key with one column per pivot column)
+    """
+    hidden = c.PIVOT_HIDDEN_ITEMS['Inventory by WH'][column_field]
+    areas = inventory_df[column_field].map(item_name)
+    visible = ~areas.isin(hidden)
+
+    table = pd.pivot_table(
+        pd.DataFrame({
+            'part': key_text(inventory_df[row_field].map(item_name).where(inventory_df[row_field].notna())),
+            'area': areas,
+            'qty': pd.to_numeric(inventory_df[data_field], errors='coerce').fillna(0),
+        })[visible],
+        index='part', columns='area', values='qty', aggfunc='sum'
+    )
+    labels = sorted(table.columns, key=lambda name: item_sort_key(column_field, name))
+    table = table[labels]
+    table['Grand Total'] = table.sum(axis=1)
+    return labels, table
+
+def compute_tpr_area_values(tpr_df, inventory_df, area_table=None):
+    """
+    Computes the values of the TPR Inventory formula columns (formula_map_tpr) from a part -> Area
+    aggregation of the QOH data (tpr_area_table).
+
+    Parameters:
+    - tpr_df: TPR Inventory frame (column A part, column K on-hand quantity)
+    - inventory_df: QOH frame with the Area column mapped
+    - area_table: tpr_area_table output already computed, used instead of inventory_df (chunked streaming mode)
+
+    Returns:
+    - tuple: (visible Area labels, DataFrame with one column per formula_map_tpr column index)
+    """
+    labels, table = area_table or tpr_area_table(inventory_df)
+
+    # VLOOKUP(..., 'Inventory by WH'!$O:$T, n) reads the n-th pivot column, empty cells and missing parts give 0
+    lookup = table.reindex(key_text(tpr_df.iloc[:, 0])).fillna(0)
+    pivot_columns = list(table.columns)
+    values = pd.DataFrame(index=tpr_df.index)
+    for col_index, lookup_col in zip(range(17, 22), range(2, 7)):
+        if lookup_col - 2 < len(pivot_columns):
+            values[col_index] = lookup[pivot_columns[lookup_col - 2]].to_numpy()
+        else:
+            values[col_index] = 0.0
+
+    quantity = widen_floats(pd.to_numeric(tpr_df.iloc[:, 10], errors='coerce')) # Column K
+    quantity = quantity.where(quantity.notna() | tpr_df.iloc[:, 10].notna(), 0) # blank cells compare as 0, text never matches
+    values[22] = values[21] == quantity # Column V
+    values[23] = values[[17, 18, 19, 20, 21]].sum(axis=1) # Column W
+    values[24] = quantity == values[23] # Column X
+
+    print(f"TPR Inventory values computed for {len(values)} rows.")
+    return labels, values
+
+def write_formula_values(ws, values, formula_map=None):
+    """
+    Writes computed formula column values (Summary / TPR Inventory) from row 2. When formula_map is given, the formula each column
+    stands for is attached to its header cell as a comment for auditability.
+    """
+    for row_idx, row in enumerate(values.astype(object).itertuples(index=False, name=None), start=2):
+        for col_index, value in zip(values.columns, row):
+            ws.cell(row=row_idx, column=col_index).value = value
+
+    if formula_map:
+        for col_index_str, formula_template in formula_map.items():
+            ws.cell(row=1, column=int(col_index_str)).comment = Comment(formula_template, 'TPR Automation')
+
+    print(f"Computed values written to '{ws.title}'.")
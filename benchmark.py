@@ -0,0 +1,249 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Benchmark suite: runs main / main_summary / main_all on synthetic exports (synthetic_data.py) of several sizes,
+# each run in a fresh process, and appends one record per run to RESULTS_FILE with the total wall time, CPU time,
+# peak RSS and the per-stage timings of its run report. Records carry the git revision, so runs of different
+# versions can be compared with --compare.
+
+BENCH_DIR = 'benchmarks'
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+OUT_DIR = os.path.join(BENCH_DIR, 'out')
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results.jsonl')
+
+RUNS = {'main': ('main', 'main', 'TPR'), 'main_summary': ('main_summary', 'main_summary', 'Summary'), 'main_all': ('main_all', 'main_all', 'All')}
+
+# Defaults of a benchmark run: no Excel on the benchmark machine, and a cold stage cache unless --cache is given
+DEFAULT_SETTINGS = {'PIVOT_BACKEND': 'local', 'STAGE_CACHE': False}
+
+def git_revision():
+    """
+    Returns (short commit hash, dirty flag) of the working tree, (None, None) outside a git checkout.
+    """
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout.strip())
+        return revision, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def data_folder(rows, seed):
+    """
+    Returns the folder of the synthetic inputs of a size, generating them on first use.
+    """
+    folder = os.path.join(DATA_DIR, f"{rows}_{seed}")
+    if not os.path.exists(os.path.join(folder, 'TPR HEADER.xlsx')):
+        from synthetic_data import generate
+        generate(rows, folder, seed)
+    return folder
+
+def run_settings(folder, tag, settings):
+    """
+    Returns the constants overrides of one benchmark run: inputs from the synthetic folder, outputs under OUT_DIR.
+    """
+    return {
+        **DEFAULT_SETTINGS,
+        'source_file': os.path.join(folder, 'Time Phase Material Requirement.csv'),
+        'qoh_file': os.path.join(folder, 'Quantity on hand.xlsx'),
+        'header_file': os.path.join(folder, 'TPR HEADER.xlsx'),
+        'dest_file': os.path.join(OUT_DIR, f"TPR_{tag}.xlsx"),
+        'dest_summary_file': os.path.join(OUT_DIR, f"TPR_SUMMARY_{tag}.xlsx"),
+        'file_path_win32': os.path.abspath(os.path.join(OUT_DIR, f"TPR_{tag}.xlsx")),
+        'file_path_summary_win32': os.path.abspath(os.path.join(OUT_DIR, f"TPR_SUMMARY_{tag}.xlsx")),
+        'RUN_REPORT': True,
+        'RUN_REPORT_FILE': os.path.join(OUT_DIR, f"run_report_{tag}_{{run}}.json"),
+        'PROFILE_FILE': os.path.join(OUT_DIR, f"profile_{tag}_{{run}}.prof"),
+        **settings,
+    }
+
+def run_worker(run, settings):
+    """
+    Entry point of the benchmark subprocess: applies the constants overrides and runs the report.
+    """
+    import constants as c
+    for name, value in settings.items():
+        setattr(c, name, value)
+    module_name, function_name, _ = RUNS[run]
+    module = __import__(module_name)
+    getattr(module, function_name)()
+
+def benchmark_run(run, rows, seed, settings, label):
+    """
+    Runs one report in a fresh process and returns its benchmark record.
+    """
+    folder = data_folder(rows, seed)
+    tag = f"{run}_{rows}"
+    settings = run_settings(folder, tag, settings)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    report_path = settings['RUN_REPORT_FILE'].format(run=RUNS[run][2])
+    if os.path.exists(report_path):
+        os.remove(report_path)
+
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, __file__, '--worker', run, json.dumps(settings)], capture_output=True, text=True)
+    wall_s = round(time.perf_counter() - start, 3)
+    if process.returncode != 0:
+        print(process.stdout)
+        print(process.stderr)
+
+    report = {}
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+    stages = report.get('stages', [])
+    total = next((record for record in stages if record['stage'] == 'total'), {})
+    revision, dirty = git_revision()
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'dirty': dirty,
+        'label': label,
+        'run': run,
+        'rows': rows,
+        'seed': seed,
+        'status': 'ok' if process.returncode == 0 else report.get('status', f"exit code {process.returncode}"),
+        'process_wall_s': wall_s, # includes interpreter start-up and imports
+        'wall_s': total.get('wall_s'),
+        'cpu_s': total.get('cpu_s'),
+        'peak_rss_mb': total.get('peak_rss_mb'),
+        'cpu_scope': 'parent+workers' if total.get('workers') else 'process', # main_all workers included, see run_trace.add_worker_totals
+        'settings': {name: value for name, value in settings.items() if name.isupper() and name not in ('RUN_REPORT_FILE', 'PROFILE_FILE')},
+        'stages': [{key: record.get(key) for key in ('stage', 'report', 'wall_s', 'cpu_s', 'peak_rss_mb', 'alloc_peak_mb', 'rows_out') if key in record}
+                   for record in stages if record['stage'] != 'total'],
+    }
+
+def com_formulas_run(rows, settings, label):
+    """
+    Times data_manipulation.generate_formula_TPR_SUMMARY on an in-memory fake of the Excel COM objects (fake_com.py)
+    with a 'TPR Inventory' sheet of `rows` rows, and counts its COM calls. Runs in this process, no Excel needed.
+    """
+    import constants as c
+    from data_manipulation import generate_formula_TPR_SUMMARY
+    from fake_com import FakeWorkbook
+    batch_rows = settings.get('FORMULA_BATCH_ROWS', c.FORMULA_BATCH_ROWS)
+    wb = FakeWorkbook()
+    ws = wb.add_sheet('TPR Inventory')
+    for row in range(1, rows + 2):
+        ws.set(row, 1, f"P{row:06d}")
+
+    start, cpu_start = time.perf_counter(), time.process_time()
+    generate_formula_TPR_SUMMARY(wb, 'TPR Inventory', c.formula_map_tpr, batch_rows=batch_rows)
+    revision, dirty = git_revision()
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'dirty': dirty,
+        'label': label,
+        'run': 'com_formulas',
+        'rows': rows,
+        'seed': None,
+        'status': 'ok',
+        'wall_s': round(time.perf_counter() - start, 3),
+        'cpu_s': round(time.process_time() - cpu_start, 3),
+        'peak_rss_mb': None,
+        'com_calls': wb.com_calls,
+        'settings': {'FORMULA_BATCH_ROWS': batch_rows},
+        'stages': [],
+    }
+
+def save_record(record):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    with open(RESULTS_FILE, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+def load_records():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def cpu_scope(record):
+    """
+    What the CPU time and peak RSS of a record cover. Records stored before the worker figures were added only
+    measured the parent process of main_all, whose workers do the parsing and workbook building.
+    """
+    if 'cpu_scope' in record:
+        return record['cpu_scope']
+    return 'parent only' if record['run'] == 'main_all' else 'process'
+
+def compare_results():
+    """
+    Prints the latest result of every (run, rows) per revision/label, with the change against the oldest revision listed.
+    CPU time and peak RSS marked 'parent only' leave out the worker processes and cannot be compared with the others.
+    """
+    latest = {}
+    for record in load_records():
+        if record['status'] != 'ok':
+            continue
+        version = f"{record['revision']}{'+' if record['dirty'] else ''}" + (f" ({record['label']})" if record['label'] else '')
+        latest[(record['run'], record['rows'], version)] = record # later records replace earlier ones
+
+    print(f"{'run':<14}{'rows':>10}  {'version':<28}{'wall s':>9}{'cpu s':>9}{'peak MB':>10}{'vs first':>10}  {'cpu/peak of'}")
+    for run, rows in sorted({(run, rows) for run, rows, _ in latest}):
+        base = None
+        for (run_, rows_, version), record in sorted(latest.items(), key=lambda item: item[1]['timestamp']):
+            if (run_, rows_) != (run, rows):
+                continue
+            base = base or record['wall_s']
+            change = f"{(record['wall_s'] / base - 1) * 100:+.1f}%" if base else ''
+            print(f"{run:<14}{rows:>10}  {version:<28}{record['wall_s'] or 0:>9.2f}{record['cpu_s'] or 0:>9.2f}{record['peak_rss_mb'] or 0:>10.1f}{change:>10}  {cpu_scope(record)}")
+
+def parse_setting(text):
+    """
+    Parses a NAME=VALUE constants override, the value as a Python literal ('write_only', 200000, True, ...).
+    """
+    name, _, value = text.partition('=')
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value # bare strings
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark the TPR reports on synthetic exports and store the results for comparison across versions.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000], help='csv sizes to benchmark')
+    parser.add_argument('--runs', nargs='+', choices=list(RUNS), default=list(RUNS), help='entry points to benchmark')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of every size and entry point')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic inputs')
+    parser.add_argument('--label', default='', help='label stored with the results (e.g. the config being tried)')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='NAME=VALUE', help='constants override, e.g. --set OUTPUT_BACKEND=\'write_only\'')
+    parser.add_argument('--cache', action='store_true', help='keep STAGE_CACHE on (warm reruns)')
+    parser.add_argument('--com-formulas', action='store_true', help='only time the batched formula writes on the fake COM workbook (fake_com.py)')
+    parser.add_argument('--compare', action='store_true', help='only print the stored results')
+    parser.add_argument('--worker', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run, settings = args.worker
+        run_worker(run, json.loads(settings))
+        return
+    if args.compare:
+        compare_results()
+        return
+
+    settings = dict(parse_setting(text) for text in args.settings)
+    if args.cache:
+        settings['STAGE_CACHE'] = True
+    if args.com_formulas:
+        for rows in args.rows:
+            for _ in range(args.repeat):
+                record = com_formulas_run(rows, settings, args.label)
+                save_record(record)
+                print(f"com_formulas on {rows} rows: {record['wall_s']}s wall, {record['com_calls']} COM calls (FORMULA_BATCH_ROWS={record['settings']['FORMULA_BATCH_ROWS']}).")
+        compare_results()
+        return
+    for rows in args.rows:
+        for run in args.runs:
+            for _ in range(args.repeat):
+                record = benchmark_run(run, rows, args.seed, settings, args.label)
+                save_record(record)
+                print(f"{run} on {rows} rows: {record['wall_s']}s wall, {record['cpu_s']}s CPU, {record['peak_rss_mb']} MB peak RSS ({record['status']}).")
+    compare_results()
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -12,27 +12,79 @@ dest_summary_file = 'dest/TPR_SUMMARY(final).xlsx'
 # Files for win32 library
 file_path_win32 = r"C:\Users\xinyi.moh\ExcelAutomation\dest\TPR(final).xlsx"
 file_path_summary_win32 = r"C:\Users\xinyi.moh\ExcelAutomation\dest\TPR_SUMMARY(final).xlsx"
-header_path_win32 = r"C:\Users\xinyi.moh\ExcelAutomation\source\TPR HEADER.xlsx"
+
+# Csv columns read per report (column letters of the export), in sheet order. Columns that are not listed are never parsed,
+# the kept columns are named with the header row of 'header_sheet' in the header workbook
+CSV_SCHEMAS = {
+    'TPR': {
+        'header_sheet': 'Header',
+        'columns': ['B', 'K', 'L', 'M', 'N', 'Q', 'R', 'AU', 'AW', 'AX', 'AY', 'AZ', 'BA', 'BB', 'BC', 'BK'],
+    },
+    'Summary': {
+        'header_sheet': 'SummaryHeader',
+        'columns': ['B', 'K', 'L', 'M', 'N', 'Q', 'S', 'AA', 'AB', 'AU', 'AV', 'AW', 'AX', 'AY', 'AZ', 'BA', 'BB', 'BC', 'BK'],
+    },
+}
+CSV_TEXT_COLUMNS = ['B', 'M'] # kept as text even when empty
+CSV_SOURCE_COLUMN = 'AW' # Source, classified into the Source flags
+CSV_DATE_COLUMN = 'txtDueDate'
+
+# How the csv columns are typed: 'text' reads every column as text (numbers are converted after filtering by convert_to_numeric),
+# 'typed' reads the CSV_COLUMN_DTYPES columns as compact dtypes (categories, float32) to cut the ingestion memory
+CSV_DTYPE_MODE = 'text'
+CSV_COLUMN_DTYPES = {
+    'M': 'category', # Class
+    'N': 'category', # Type
+    'R': 'category', # Warehouse
+    'AW': 'category', # Source
+    'AY': 'float32', # Receipts
+    'AZ': 'float32', # Requirements (Summary column O)
+    'BA': 'float32', # On-hand Stock
+}
+
+# Keep the whole csv export as a hidden 'Sheet1' (the full export is then parsed once more)
+KEEP_RAW_SHEET = False
+
+# Stage cache: the csv parse, Working prep + partitions, inventory import and aggregations are cached in STAGE_CACHE_DIR,
+# keyed by a hash of their inputs (file contents, config, code); least recently used entries are evicted past STAGE_CACHE_MAX_MB
+STAGE_CACHE = True
+STAGE_CACHE_DIR = '.cache/stages'
+STAGE_CACHE_MAX_MB = 1024
+
+# Run report: wall time, CPU time, peak RSS and rows in/out of every pipeline stage (and COM phase) written as JSON
+# after each run ({run} is 'TPR', 'Summary' or 'All'). TRACE_MEMORY adds tracemalloc deltas per stage (slower run),
+# PROFILE_RUN dumps a cProfile of the whole run (open with pstats or snakeviz)
+RUN_REPORT = True
+RUN_REPORT_FILE = 'dest/run_report_{run}.json'
+TRACE_MEMORY = False
+PROFILE_RUN = False
+PROFILE_FILE = 'dest/profile_{run}.prof'
+
+# main_all.py: processes building the TPR and TPR Summary workbooks side by side (1 builds them one after the other)
+REPORT_WORKERS = 2
+
+# main_batch.py: daily snapshots ('20250428_0810H, Time Phase Material Requirement.csv' + the Quantity on hand file of the
+# same day) found under BATCH_SOURCE_DIR (one sub folder per site) are built side by side in BATCH_WORKERS processes
+# (None: one per CPU), each into its own folder of BATCH_DEST_DIR. BATCH_WORKER_MEMORY_MB caps the memory of a worker
+# (Linux/macOS), a snapshot going over it fails alone instead of the whole machine swapping
+BATCH_SOURCE_DIR = 'source'
+BATCH_DEST_DIR = 'dest/batch'
+BATCH_WORKERS = None
+BATCH_WORKER_MEMORY_MB = None
+BATCH_CSV_PATTERN = r'^(\d{8})_(\d{4})H, Time Phase Material Requirement\.csv$'
+BATCH_QOH_PATTERN = r'^(\d{8})_(\d{4})H, Quantity on hand\.xlsx$'
+
+# main_watch.py: WATCH_SOURCE_DIR is polled every WATCH_POLL_SECONDS, a snapshot is built once its csv and Quantity on
+# hand files have kept the same size and modification time for WATCH_SETTLE_SECONDS (fully written), into WATCH_DEST_DIR.
+# Snapshots already in the folder when the watcher starts are skipped unless WATCH_PROCESS_EXISTING
+WATCH_SOURCE_DIR = 'source'
+WATCH_DEST_DIR = 'dest/watch'
+WATCH_POLL_SECONDS = 5
+WATCH_SETTLE_SECONDS = 10
+WATCH_PROCESS_EXISTING = False
 
 # Columns to be deleted 
-COLUMNS_TO_DELETE_WORKING  = [
-    "A",  # Single column
-    *[chr(c) for c in range(ord("C"), ord("K"))],  # C to J
-    "O", "P",
-    *[chr(c) for c in range(ord("S"), ord("U"))] + ['U', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE', 'AF', 'AG', 'AH', 'AI', 'AJ', 'AK', 'AL', 'AM', 'AN', 'AO', 'AP', 'AQ', 'AR', 'AS', 'AT'],
-    "AV",
-    *["BD", "BE", "BF", "BG", "BH", "BI", "BJ"]
-]
-COLUMNS_TO_DELETE_SUMMARY_WORKING = [
-    "A",  # Single column
-    *[chr(c) for c in range(ord("C"), ord("K"))],  # C to J
-    "O", "P", "R",  # Individual columns
-    *[chr(c) for c in range(ord("T"), ord("Z") + 1)],  # T to Z
-    *["AC", "AD", "AE", "AF", "AG", "AH", "AI", "AJ", "AK", "AL", "AM", "AN", "AO", "AP", "AQ", "AR", "AS", "AT"],  # AC to AT
-    *[f"B{chr(c)}" for c in range(ord("D"), ord("K"))]  # BD to BJ
-]
 COLUMNS_TO_DELETE_MRP = ['L', 'M', 'N', 'O','P']
-COLUMNS_TO_DELETE_SCHEDULE = ['U','V']
 
 # Columns to be added 
 COLUMNS_TO_ADD_SCHEDULE = ['MRP','MO','EXPEDITE','POSTPONE']
@@ -41,6 +93,49 @@ COLUMNS_TO_ADD_TPR = ['Delta','Total','Delta2']
 COLUMNS_TO_COPY_SUMMARY = [1, 2, 3, 4, 5, 6, 7, 16] # Columns A to G and P 
 COLUMNS_TO_ADD_SUMMARY = ['MO','PO','SO','Forecast','MO Comp','Available','Available with MRP','MRP','MRP Comp','Suggestion','Demand','Supply']
 
+# Source categories, each distinct 'Source' value is classified once into bit flags (in this order)
+# 'contains' is case-insensitive, 'startswith' is case-sensitive
+SOURCE_FLAGS_COLUMN = '_source_flags' # internal column, never written to the sheets
+SOURCE_CATEGORIES = {
+    'MRP': ('contains', 'MRP'),
+    'Job': ('contains', 'Job'),
+    'Job Start': ('startswith', 'Job'),
+    'SO': ('contains', 'SO:'),
+    'PO': ('contains', 'PO:'),
+    'Forecast': ('contains', 'Forecast'),
+    'Suggestion': ('contains', 'Suggestion'),
+    'On-hand': ('contains', 'On-hand'),
+    'On-hand Quantity': ('contains', 'On-Hand Quantity'),
+    'Expedite': ('contains', 'Expedite'),
+    'Postpone': ('contains', 'Postpone'),
+}
+
+# Columns left as text by the numeric conversion
+NUMERIC_SKIP_COLUMNS = ['PartNum','Class','Due Date']
+
+# Pivot backend: 'excel' builds PivotTables through win32com, 'local' writes static pivot blocks with pandas (no Excel needed)
+PIVOT_BACKEND = 'excel'
+
+# Output backend: 'standard' builds the workbook in memory with openpyxl, 'write_only' streams every sheet row by row
+# (openpyxl write_only mode) so memory stays bounded by the rows being written
+OUTPUT_BACKEND = 'standard'
+
+# Rows converted from a frame at a time when a sheet is streamed 
+WRITE_CHUNK_ROWS = 10000
+
+# Chunked streaming mode: rows of the csv export read at a time (None reads the whole export at once). When set, every chunk
+# is partitioned and spilled to a temporary folder, pivots and summary totals are accumulated chunk by chunk and the
+# workbook is written with the write_only backend, so memory stays flat whatever the size of the export
+CSV_CHUNK_ROWS = None
+
+# Pivot items shown (filter fields) and hidden, per pivot sheet
+PIVOT_FILTER_ITEMS = {'Schedule': {'Class': ['01', '41']}}
+PIVOT_HIDDEN_ITEMS = {'Inventory by WH': {'Area': ['0', '#N/A', '(blank)']}}
+
+# Workbook names carrying the MRP summary info figures (computed from the MRP frame) from the openpyxl phase to the
+# win32com phase, which writes them below the MRP PivotTable once Excel has built it
+MRP_SUMMARY_NAMES = {'parts': 'TPR_Total_Parts', 'up_till': 'TPR_Data_Up_Till'}
+
 # Table ranges 
 MRP_Table_Range = 'MRP!$A:$K' 
 Schedule_Table_Range = 'Schedule!$A:$V'
@@ -51,6 +146,13 @@ Inventory_Formula_Range = 'F:F'
 due_date_idx = 10 
 due_date_idx_summary = 13
 
+# Rows per COM call when formulas are pasted as 2-D arrays 
+FORMULA_BATCH_ROWS = 20000
+
+# How the TPR Inventory formula columns (Q to X) are written: 'formulas' (VLOOKUP formulas), 'values' (computed
+# from a part -> Area aggregation of the QOH data) or 'both' (values, with the formulas as header comments)
+TPR_FORMULA_MODE = 'formulas'
+
 #TPR formula 
 formula_map_tpr = {
     '17': "=IFERROR(VLOOKUP($A{row}, 'Inventory by WH'!$O:$T,2,FALSE),0)", # Column Q
@@ -63,6 +165,22 @@ formula_map_tpr = {
     '24': "=IFERROR(K{row}=W{row}, FALSE)" # Column X
 }
 
+# How the Summary formula columns are written: 'formulas' (SUMIFS formulas), 'values' (computed with pandas groupby)
+# or 'both' (computed values, with each column's formula attached to its header cell as a comment)
+SUMMARY_FORMULA_MODE = 'formulas'
+
+#TPR Summary SUMIFS columns computed with pandas: (sheet, summed column, criteria column, criteria), keyed on column A
+summary_aggregations = {
+    '9': ('MO', 'N', 'L', '<>Job: MRP*'), # Column I (MO)
+    '10': ('PO', 'N', None, None), # Column J (PO)
+    '11': ('SO', 'O', None, None), # Column K (SO)
+    '12': ('Forecast', 'O', None, None), # Column L (Forecast)
+    '13': ('MO', 'O', 'L', '<>Job: MRP*'), # Column M (MO Comp)
+    '16': ('MO', 'N', 'L', '=Job: MRP*'), # Column P (MRP)
+    '17': ('MO', 'O', 'L', '=Job: MRP*'), # Column Q (MRP Comp)
+    '18': ('Suggestion', 'N', None, None), # Column R (Suggestion)
+}
+
 #TPR Summary formula 
 formula_map_summary = {
     '9': '=IFERROR(SUMIFS(MO!$N:$N,MO!$A:$A,Summary!$A{row},MO!$L:$L,"<>Job: MRP*"),0)', # Column I (MO)
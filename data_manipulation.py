@@ -1,6 +1,9 @@
+import calendar
 import constants as c 
-from worksheet_manager import add_year_month_columns
+import pandas as pd
 from datetime import datetime 
+from helper import overdue_formula
+from openpyxl.utils import get_column_letter
 
 def add_pivot_field(pivot_table, field, orientation, position):
     """Helper function to add a field to the pivot table with specified orientation and position."""
@@ -60,7 +63,7 @@ def pivot_table_config(ws, table_range, pivot_table_location, row_field=None, co
         class_field = pivot_table.PivotFields("Class")
 
         # Filter the pivot table to show only the 01 and 41 classes 
-        allowed_classes = ["01", "41"]
+        allowed_classes = c.PIVOT_FILTER_ITEMS['Schedule']['Class']
 
         # Loop through all items in the Class field
         for item in class_field.PivotItems():
@@ -98,7 +101,7 @@ def pivot_table_config(ws, table_range, pivot_table_location, row_field=None, co
             column_labels = pivot_table.PivotFields("Area")
 
             # Define items you want to hide
-            unwanted_columns = ["0", "#N/A", "(blank)"]
+            unwanted_columns = c.PIVOT_HIDDEN_ITEMS['Inventory by WH']['Area']
 
             for item in column_labels.PivotItems():
                 try:
@@ -113,118 +116,83 @@ def pivot_table_config(ws, table_range, pivot_table_location, row_field=None, co
 
     return pivot_table
 
-def write_summary_info(ws,start_cell = 'O1'): # Write summary info for the MRP sheet (Total No. of Parts, Data shown up till...)
-    # Get last row of pivot table (assuming it starts at O1)
-    start_row = ws.Range(start_cell).Row
-    start_col = ws.Range(start_cell).Column
-    cur_row = start_row
-
-    # Find the bottom of pivot table by scanning downward
-    while ws.Cells(cur_row, start_col).Value not in [None, ""]:
-        cur_row += 1
-    summary_row = cur_row + 1  # two rows below the pivot table
-
-    # Count unique parts in Column A
-    unique_parts = set()
-    last_data_row = ws.Cells(ws.Rows.Count, 1).End(-4162).Row  # xlUp
-    for i in range(2, last_data_row + 1):
-        val = ws.Cells(i, 1).Value
-        if val:
-            unique_parts.add(val)
-    ws.Cells(summary_row, start_col).Value = "Total No. of Parts"
-    ws.Cells(summary_row, start_col + 1).Value = len(unique_parts)
-
-     # Bold and color the two cells
-    for col_offset in range(2):
-        cell = ws.Cells(summary_row, start_col + col_offset)
-        cell.Font.Bold = True
-        cell.Interior.Color = 15773696 # Blue colour     
-
-    largest_month = None
-    due_date_col = c.due_date_idx
-    last_row = ws.Cells(ws.Rows.Count, due_date_col).End(-4162).Row  # xlUp = -4162 to find the last row with data
-    for i in range(2, last_row + 1):
-        val = ws.Cells(i, due_date_col).Value  # Column I
-
-        if isinstance(val, datetime):
-            if largest_month is None or val > largest_month:
-                largest_month = val
-        #print(ws.Cells(i, 9).Value, type(ws.Cells(i, 9).Value))
-
-    # Write largest month to sheet
-    if largest_month: 
-        ws.Cells(summary_row + 2, start_col).Value = f"Data shown up till {largest_month.strftime('%b %Y')}"
-        ws.Cells(summary_row + 2, start_col).Font.Bold = True
-    
 def insert_pt(wb,sheet_name, table_range,pivot_table_location,row_field = None ,column_field = None,data_field = None ,filter_field = None ):
+    """
+    Builds a PivotTable in Excel from a pivot_table_generator config.
 
+    Returns:
+    - dict: extent of the pivot table ('first_row', 'first_col', 'last_row', 'last_col'), to place annotations beside it
+    """
     ws = wb.Sheets(sheet_name)
+    pivot_table = None
 
     if sheet_name.strip() == 'Schedule':
-        add_year_month_columns(ws)
-        pivot_table_config(ws, table_range, pivot_table_location, row_field, column_field, data_field, filter_field)
-        for col_idx in sorted(c.COLUMNS_TO_DELETE_SCHEDULE, reverse=True):
-            ws.Columns(col_idx).Delete()
-        write_legend(ws)
+        pivot_table = pivot_table_config(ws, table_range, pivot_table_location, row_field, column_field, data_field, filter_field) # Year/Month already written in the openpyxl phase
+        write_legend(ws, pivot_extent(pivot_table))
+        highlight_overdue(ws, pivot_extent(pivot_table))
 
     if sheet_name.strip() == 'MRP':
-        pivot_table_config(ws, table_range, pivot_table_location, row_field, column_field, data_field, filter_field)
-        write_summary_info(ws, pivot_table_location) # write summary info if its MRP sheet 
-        print("Summary info written in mrp sheet.")
+        pivot_table = pivot_table_config(ws, table_range, pivot_table_location, row_field, column_field, data_field, filter_field)
+        write_summary_info(wb, ws, pivot_extent(pivot_table))
 
     if sheet_name.strip() == "Inventory by WH":
         ws.Columns(1).Delete()
         col_H = ws.Cells(1,8)
         print(col_H)
         print(type(ws.Range("H2").Value))
-        pivot_table_config(ws, table_range, pivot_table_location, row_field, column_field, data_field, filter_field)
+        pivot_table = pivot_table_config(ws, table_range, pivot_table_location, row_field, column_field, data_field, filter_field)
 
     print("Pivot table inserted.")
+    return pivot_extent(pivot_table) if pivot_table is not None else None
 
-def fill_blank_due_dates(ws, due_date_col=c.due_date_idx, replacement_date=datetime(2030, 12, 31)):
+def fill_blank_due_dates(df, due_date_col=c.due_date_idx, replacement_date=datetime(2030, 12, 31)):
     """
-    Replace blank/empty-looking cells in the due date column with 31/12/2030 in the schedule tab.
+    Replace blank/empty-looking due dates of the Schedule frame with 31/12/2030 before the sheet is written.
     """
-    updated = False
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=due_date_col, max_col=due_date_col):
-        cell = row[0]
-        cell_val = cell.value
-
-        # Check for any kind of blank: None, "", string with only whitespace, Excel-blank, etc.
-        if cell_val is None or str(cell_val).strip() == '' or str(cell_val) in ['NaT', 'nan']:
-            cell.value = replacement_date
-            updated = True
-
-    if updated:
-        print("Blanks have been set to 31/12/2030 in the schedule tab.")
-    else:
+    due_dates = df.iloc[:, due_date_col - 1]
+    blank = due_dates.isna() | (due_dates.astype(str).str.strip() == '')
+    if not blank.any():
         print("No empty cells found in due date column.")
-        print(f"Row {cell.row}: '{cell_val}' (type: {type(cell_val)})")
+        return df
 
-def write_legend(ws): 
+    df = df.copy()
+    df.isetitem(due_date_col - 1, due_dates.mask(blank, replacement_date))
+    print("Blanks have been set to 31/12/2030 in the schedule tab.")
+    return df
+
+def year_month_frame(df, due_date_col=c.due_date_idx):
     """
-    Writes 'Legend' (bold) and 'Overdue/Late' (italic) beside the pivot table in the schedule sheet.
+    Returns the Year and Month ('Jan', 'Feb', ...) of every due date of the Schedule frame (row fields of the
+    Schedule pivot), derived with vectorized datetime ops. Rows without a date get empty cells.
     """
-    start_col = 21  # Column U
-    start_row = 1
-
-    # Find the last used row and column from U1 onwards
-    first_used_row = start_row
-    last_used_col = start_col
+    due_dates = pd.to_datetime(df.iloc[:, due_date_col - 1], errors='coerce')
+    has_date = due_dates.notna().to_numpy()
+    return pd.DataFrame({
+        'Year': due_dates.dt.year.astype('Int64').astype(object).where(has_date, None).to_numpy(),
+        'Month': due_dates.dt.month.map(dict(enumerate(calendar.month_abbr))).where(has_date, None).to_numpy(),
+    })
+
+def pivot_extent(pivot_table):
+    """
+    Returns the cells covered by a PivotTable, filter fields included (TableRange2), read in a few COM calls.
 
-    used_range = ws.UsedRange
-    max_row = used_range.Rows.Count
-    max_col = used_range.Columns.Count
+    Returns:
+    - dict: 'first_row', 'first_col', 'last_row', 'last_col' (same keys as local_backend.insert_local_pt)
+    """
+    table_range = pivot_table.TableRange2
+    first_row, first_col = table_range.Row, table_range.Column
+    return {'first_row': first_row, 'first_col': first_col,
+            'last_row': first_row + table_range.Rows.Count - 1, 'last_col': first_col + table_range.Columns.Count - 1}
 
-    for row in range(start_row, max_row + 1):
-        for col in range(start_col, max_col + 1):
-            cell_value = ws.Cells(row, col).Value
-            if cell_value not in (None, ""):
-                first_used_row = min(first_used_row, row)
-                last_used_col = max(last_used_col, col)
+def write_legend(ws, pivot): 
+    """
+    Writes 'Legend' (bold) and 'Overdue/Late' (italic) beside the pivot table in the schedule sheet.
 
-    legend_row = first_used_row + 2
-    legend_col = last_used_col + 2
+    Parameters:
+    - pivot: extent of the Schedule pivot table (pivot_extent)
+    """
+    legend_row = pivot['first_row'] + 2
+    legend_col = pivot['last_col'] + 2
 
     # Write "Legend" (bold)
     legend_cell = ws.Cells(legend_row, legend_col)
@@ -240,20 +208,85 @@ def write_legend(ws):
 
     print(f"Legend written at {legend_row},{legend_col}")
 
-def insert_inventory_formula(wb_main,wb_header):
+def summary_info_value(wb, ws, name):
+    # Value of a workbook name set in the openpyxl phase (None when missing), the name is removed once read
+    try:
+        defined_name = wb.Names(name)
+    except Exception:
+        return None
+    value = ws.Evaluate(name)
+    defined_name.Delete()
+    return value
+
+def write_summary_info(wb, ws, pivot):
+    """
+    Writes the MRP summary info (Total No. of Parts, Data shown up till) two rows below the pivot table. The figures
+    come from the MRP frame through workbook names (local_backend.mrp_summary_names), so no sheet scan is needed.
+
+    Parameters:
+    - pivot: extent of the MRP pivot table (pivot_extent)
+    """
+    summary_row = pivot['last_row'] + 2 # one blank row below the pivot table
+    first_col = pivot['first_col']
+
+    parts = summary_info_value(wb, ws, c.MRP_SUMMARY_NAMES['parts'])
+    if parts is not None:
+        ws.Cells(summary_row, first_col).Value = "Total No. of Parts"
+        ws.Cells(summary_row, first_col + 1).Value = int(parts)
+        cells = ws.Range(ws.Cells(summary_row, first_col), ws.Cells(summary_row, first_col + 1))
+        cells.Font.Bold = True
+        cells.Interior.Color = 15773696 # Blue colour
+
+    up_till = summary_info_value(wb, ws, c.MRP_SUMMARY_NAMES['up_till'])
+    if up_till:
+        ws.Cells(summary_row + 2, first_col).Value = up_till
+        ws.Cells(summary_row + 2, first_col).Font.Bold = True
+    print(f"Summary info written in mrp sheet at row {summary_row}.")
+
+def highlight_overdue(ws, pivot):
+    """
+    Highlights the overdue dates of the Schedule pivot in yellow (Overdue/Late in the legend) with one conditional-format
+    rule over its row labels column, instead of colouring the date cells one by one.
 
-    ws = wb_main.Sheets('Inventory by WH')
-    header_wb_name = wb_header.Name  # e.g. 'TPR HEADER.xlsx'
+    Parameters:
+    - pivot: extent of the Schedule pivot table (pivot_extent)
+    """
+    first_cell = f"{get_column_letter(pivot['first_col'])}{pivot['first_row']}"
+    cell_range = ws.Range(ws.Cells(pivot['first_row'], pivot['first_col']), ws.Cells(pivot['last_row'], pivot['first_col']))
+    # Excel reads the relative row of an xlExpression rule against the active cell: add it from the range's first cell
+    ws.Activate()
+    cell_range.Cells(1, 1).Activate()
+    condition = cell_range.FormatConditions.Add(Type=2, Formula1=f"={overdue_formula(first_cell)}") # xlExpression
+    condition.Interior.Color = 65535  # Yellow
+    print(f"Overdue dates highlighted in {first_cell}:{get_column_letter(pivot['first_col'])}{pivot['last_row']}.")
+
+def map_inventory_area(inventory_df, area_ws, warehouse_col=5):
+    """
+    Maps every warehouse of the QOH data (column E) to its Area from the 'Area' table (A:B) of the header
+    workbook with a keyed lookup, and inserts the result as the Area column (F). Same result as the
+    VLOOKUP pasted as values: keys match case-insensitively, the first match wins, blank Areas become 0
+    and warehouses missing from the table are set to '#N/A' and reported.
+    """
+    area_map = {}
+    for warehouse, area in area_ws.iter_rows(min_row=1, min_col=1, max_col=2, values_only=True):
+        if warehouse not in (None, ''):
+            area_map.setdefault(str(warehouse).strip().casefold(), 0 if area in (None, '') else area)
 
-    last_row = ws.Cells(ws.Rows.Count, 'E').End(-4162).Row  # -4162 is xlUp
-    formula_range = f'F2:F{last_row}'
-    formula = f"=VLOOKUP(E2,'[{header_wb_name}]Area'!$A:$B,2,FALSE)" 
+    warehouses = inventory_df.iloc[:, warehouse_col - 1]
+    keys = warehouses.astype(str).str.strip().str.casefold().where(warehouses.notna() & (warehouses.astype(str) != ''))
+    areas = keys.map(area_map)
 
-    ws.Range(formula_range).Formula = formula
-    ws.Range(formula_range).Copy()
-    ws.Range(formula_range).PasteSpecial(Paste=-4163)  # Paste as values
+    unmatched = warehouses[keys.notna() & areas.isna()]
+    areas = areas.where(keys.isna() | areas.notna(), '#N/A')
 
-    print(f"Area formula(Inventory by WH) pasted")
+    inventory_df = inventory_df.copy()
+    inventory_df.insert(warehouse_col, c.COLUMN_TO_ADD_WH[0], areas)
+
+    if len(unmatched):
+        counts = unmatched.astype(str).value_counts()
+        print(f"[WARNING] {len(counts)} warehouses not found in the Area table ({len(unmatched)} rows): " + ", ".join(f"{wh} ({n})" for wh, n in counts.items()))
+    print("Area column (Inventory by WH) mapped")
+    return inventory_df
 
 def create_TPR_columns(wb):
 
@@ -298,36 +331,44 @@ def create_TPR_columns(wb):
     except Exception as e:
         print(f"Error: {e}")
 
-def generate_formula_TPR_SUMMARY(wb, sheet_name, formula_map): # Generate formulas for TPR and Summary reports 
-
-        ws = wb.Sheets(sheet_name)
-
-        # Get the last row using the Excel COM method (win32com)
-        last_row = ws.Cells(ws.Rows.Count, 1).End(-4162).Row  # -4162 is xlUp
-
-        # Loop through rows and columns to set the formulas
-        for row in range(2, last_row + 1):
-            for col_index_str, formula_template in formula_map.items():
-                col_index = int(col_index_str)  # Convert string key to integer column index
-                formula = formula_template.format(row=row)
-                try:
-                    ws.Cells(row, col_index).Formula = formula
-                except Exception as e:
-                    print(f"[ERROR] Failed to insert formula at row {row}, col {col_index}: {formula}")
-                    raise
-
-        print("Formulas pasted successfully.")
-
-
-
-
-
-
-
-
-
+def formula_column_blocks(formula_map):
+    """
+    Groups the formula_map columns into blocks of adjacent columns.
 
+    Returns:
+    - list: (first column index, [formula templates left to right]) per block
+    """
+    blocks = []
+    for col_index in sorted(int(col_index_str) for col_index_str in formula_map):
+        if blocks and blocks[-1][0] + len(blocks[-1][1]) == col_index:
+            blocks[-1][1].append(formula_map[str(col_index)])
+        else:
+            blocks.append((col_index, [formula_map[str(col_index)]]))
+    return blocks
+
+def generate_formula_TPR_SUMMARY(wb, sheet_name, formula_map, batch_rows=c.FORMULA_BATCH_ROWS): # Generate formulas for TPR and Summary reports 
+    """
+    Writes the formulas of formula_map from row 2 to the last row of column A. Each block of adjacent
+    columns is assigned as one 2-D array per batch_rows rows, instead of one COM call per cell.
+    """
+    ws = wb.Sheets(sheet_name)
 
+    # Get the last row using the Excel COM method (win32com)
+    last_row = ws.Cells(ws.Rows.Count, 1).End(-4162).Row  # -4162 is xlUp
 
+    for first_col, formula_templates in formula_column_blocks(formula_map):
+        last_col = first_col + len(formula_templates) - 1
 
+        for start_row in range(2, last_row + 1, batch_rows):
+            end_row = min(start_row + batch_rows - 1, last_row)
+            formulas = tuple(
+                tuple(formula_template.format(row=row) for formula_template in formula_templates)
+                for row in range(start_row, end_row + 1)
+            )
+            try:
+                ws.Range(ws.Cells(start_row, first_col), ws.Cells(end_row, last_col)).Formula = formulas
+            except Exception as e:
+                print(f"[ERROR] Failed to insert formulas at rows {start_row}-{end_row}, cols {first_col}-{last_col}")
+                raise
 
+    print("Formulas pasted successfully.")
@@ -0,0 +1,204 @@
+from openpyxl.formula.translate import Translator
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import range_boundaries
+
+# In-memory stand-in for the subset of the Excel COM object model used by data_manipulation
+# (Sheets, Cells, Range, End, Rows/Columns.Count, Formula/Value, Font/Interior, Activate, FormatConditions, Names and
+# Evaluate). Every COM call is counted in FakeWorkbook.com_calls, so the batched writes can be run and benchmarked on
+# Linux without Excel.
+
+XL_UP = -4162
+XL_TO_LEFT = -4159
+MAX_ROWS = 1048576
+MAX_COLS = 16384
+
+class FakeCount:
+    def __init__(self, count):
+        self.Count = count
+
+class FakeInterior:
+    def __init__(self):
+        self.Color = None
+
+class FakeCellFormat:
+    """
+    Font or Interior of a range: attributes set on it are stored per cell in FakeWorksheet.formats.
+    """
+    def __init__(self, cell_range, kind):
+        object.__setattr__(self, 'cell_range', cell_range)
+        object.__setattr__(self, 'kind', kind)
+
+    def __setattr__(self, attr, value):
+        cell_range = self.cell_range
+        cell_range.ws.parent.com_calls += 1
+        for row in range(cell_range.Row, cell_range.last_row + 1):
+            for col in range(cell_range.Column, cell_range.last_col + 1):
+                cell_range.ws.formats.setdefault((row, col), {})[f"{self.kind}.{attr}"] = value
+
+class FakeName:
+    def __init__(self, wb, name):
+        self.wb = wb
+        self.Name = name
+
+    def Delete(self):
+        self.wb.com_calls += 1
+        del self.wb.names[self.Name]
+
+class FakeFormatCondition:
+    def __init__(self, formula):
+        self.Formula1 = formula
+        self.Interior = FakeInterior()
+
+class FakeFormatConditions:
+    def __init__(self, cell_range):
+        self.cell_range = cell_range
+
+    def Add(self, Type, Formula1):
+        """
+        Stores the rule the way Excel does: the relative references of Formula1 are read against the active cell, the
+        stored formula is the same rule written from the range's top-left cell.
+        """
+        cell_range = self.cell_range
+        cell_range.ws.parent.com_calls += 1
+        active_row, active_col = cell_range.ws.parent.ActiveCell
+        origin, first_cell = f"{get_column_letter(active_col)}{active_row}", f"{get_column_letter(cell_range.Column)}{cell_range.Row}"
+        condition = FakeFormatCondition(Translator(Formula1, origin=origin).translate_formula(first_cell))
+        cell_range.ws.format_conditions.append((cell_range.address, Type, condition))
+        return condition
+
+class FakeRange:
+    def __init__(self, ws, first_row, first_col, last_row=None, last_col=None):
+        self.ws = ws
+        self.Row = first_row
+        self.Column = first_col
+        self.last_row = last_row or first_row
+        self.last_col = last_col or first_col
+
+    def _get(self):
+        self.ws.parent.com_calls += 1
+        if self.Row == self.last_row and self.Column == self.last_col:
+            return self.ws.cells.get((self.Row, self.Column))
+        return tuple(
+            tuple(self.ws.cells.get((row, col)) for col in range(self.Column, self.last_col + 1))
+            for row in range(self.Row, self.last_row + 1)
+        )
+
+    def _set(self, value):
+        self.ws.parent.com_calls += 1
+        if not isinstance(value, (tuple, list)):
+            value = tuple(tuple(value for _ in range(self.Column, self.last_col + 1)) for _ in range(self.Row, self.last_row + 1))
+        for row_offset, row_values in enumerate(value):
+            for col_offset, cell_value in enumerate(row_values):
+                self.ws.set(self.Row + row_offset, self.Column + col_offset, cell_value)
+
+    Value = property(_get, _set)
+    Formula = property(_get, _set)
+
+    @property
+    def address(self):
+        return f"{get_column_letter(self.Column)}{self.Row}:{get_column_letter(self.last_col)}{self.last_row}"
+
+    @property
+    def Font(self):
+        return FakeCellFormat(self, 'Font')
+
+    @property
+    def Interior(self):
+        return FakeCellFormat(self, 'Interior')
+
+    @property
+    def FormatConditions(self):
+        self.ws.parent.com_calls += 1
+        return FakeFormatConditions(self)
+
+    def Cells(self, row, col):
+        self.ws.parent.com_calls += 1
+        return FakeRange(self.ws, self.Row + row - 1, self.Column + col - 1)
+
+    def Activate(self):
+        self.ws.parent.com_calls += 1
+        if self.ws.parent.ActiveSheet is not self.ws:
+            raise RuntimeError("Activate method of Range class failed") # a cell can only be activated on the active sheet
+        self.ws.parent.ActiveCell = (self.Row, self.Column)
+
+    def End(self, direction):
+        self.ws.parent.com_calls += 1
+        if direction == XL_UP:
+            rows = [row for (row, col), value in self.ws.cells.items() if col == self.Column and row <= self.Row and value not in (None, '')]
+            return FakeRange(self.ws, max(rows, default=1), self.Column)
+        if direction == XL_TO_LEFT:
+            cols = [col for (row, col), value in self.ws.cells.items() if row == self.Row and col <= self.Column and value not in (None, '')]
+            return FakeRange(self.ws, self.Row, max(cols, default=1))
+        raise ValueError(f"Unsupported End direction: {direction}")
+
+class FakeWorksheet:
+    def __init__(self, parent, name):
+        self.parent = parent
+        self.Name = name
+        self.cells = {}
+        self.format_conditions = [] # (range address, type, FakeFormatCondition)
+        self.formats = {} # (row, col): {'Font.Bold': True, 'Interior.Color': 65535, ...}
+        self.Rows = FakeCount(MAX_ROWS)
+        self.Columns = FakeCount(MAX_COLS)
+
+    def set(self, row, col, value):
+        if value in (None, ''):
+            self.cells.pop((row, col), None)
+        else:
+            self.cells[(row, col)] = value
+
+    def Activate(self):
+        self.parent.com_calls += 1
+        if self.parent.ActiveSheet is not self:
+            self.parent.ActiveSheet = self
+            self.parent.ActiveCell = (1, 1)
+
+    def Evaluate(self, name):
+        self.parent.com_calls += 1
+        return self.parent.names[name] # workbook names only, holding their constant value
+
+    def Cells(self, row, col):
+        self.parent.com_calls += 1
+        if isinstance(col, str):
+            col = column_index_from_string(col)
+        return FakeRange(self, row, col)
+
+    def Range(self, first, last=None):
+        self.parent.com_calls += 1
+        if isinstance(first, str):
+            min_col, min_row, max_col, max_row = range_boundaries(first)
+            return FakeRange(self, min_row, min_col, max_row, max_col)
+        last = last or first
+        return FakeRange(self, first.Row, first.Column, last.last_row, last.last_col)
+
+class FakeWorkbook:
+    def __init__(self, name='Book1.xlsx'):
+        self.Name = name
+        self.com_calls = 0
+        self.sheets = {}
+        self.names = {} # workbook name: constant value
+        self.ActiveSheet = None # the first sheet added, with A1 active
+        self.ActiveCell = (1, 1)
+
+    def add_sheet(self, name, rows=None):
+        """
+        Adds a sheet, optionally filled with a list of rows starting at A1.
+        """
+        ws = FakeWorksheet(self, name)
+        for row_idx, row in enumerate(rows or [], start=1):
+            for col_idx, value in enumerate(row, start=1):
+                ws.set(row_idx, col_idx, value)
+        self.sheets[name] = ws
+        self.ActiveSheet = self.ActiveSheet or ws
+        return ws
+
+    def Names(self, name):
+        self.com_calls += 1
+        if name not in self.names:
+            raise KeyError(name) # pywintypes.com_error in Excel
+        return FakeName(self, name)
+
+    def Sheets(self, name):
+        self.com_calls += 1
+        return self.sheets[name]
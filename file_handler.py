@@ -1,32 +1,94 @@
+import constants as c
 import pandas as pd  
+from collections import defaultdict
 from openpyxl import load_workbook
-from win32com.client import gencache
+from openpyxl.utils import column_index_from_string
+from stage_cache import file_digest
+from stage_cache import pipeline_modules
+from stage_cache import stage_key
 
-def load_and_convert_csv(input_csv_path, output_excel_path):
-    try:
-        # Load CSV
-        df = pd.read_csv(input_csv_path, dtype=str)
-        
-        # Ensure necessary columns are present
-        required_columns = ['txtDueDate']  # Add any other necessary columns here
-        for col in required_columns:
-            if col not in df.columns:
-                raise ValueError(f"Missing required column: {col}")
-        
-        # Convert columns B and M to strings 
-        df.iloc[:, 1] = df.iloc[:, 1].astype(str)  # Column B (index 1)
-        df.iloc[:, 12] = df.iloc[:, 12].astype(str) # Column M (index 12)
+try:
+    from win32com.client import gencache
+except ImportError: # Excel automation is only available on Windows, PIVOT_BACKEND = 'local' does not need it
+    gencache = None
+
+def csv_read_options(input_csv_path, columns=None, dtypes=None):
+    """
+    Returns the read_csv options of the csv export (usecols, dtype) and the columns parsed to numbers afterwards.
+
+    Parameters:
+        input_csv_path (str): The path to the csv file.
+        columns (list): Column letters to read (CSV_SCHEMAS), the other columns are skipped by the parser. None reads every column.
+        dtypes (dict): Column letter -> compact dtype (CSV_COLUMN_DTYPES), the other columns are read as text.
+
+    Returns:
+        tuple: (read_csv keyword arguments, {column name: numeric dtype})
+    """
+    usecols = sorted(column_index_from_string(col) - 1 for col in columns) if columns else None
+    dtype, numeric = str, {}
+    if dtypes:
+        csv_columns = pd.read_csv(input_csv_path, nrows=0).columns
+        typed = {
+            csv_columns[column_index_from_string(col) - 1]: kind for col, kind in dtypes.items()
+            if column_index_from_string(col) <= len(csv_columns) and (usecols is None or column_index_from_string(col) - 1 in usecols)
+        }
+        dtype = defaultdict(lambda: str, {name: kind for name, kind in typed.items() if kind == 'category'})
+        numeric = {name: kind for name, kind in typed.items() if kind != 'category'} # parsed from text below (thousands separators)
+    return {'dtype': dtype, 'usecols': usecols}, numeric
+
+def convert_csv_types(df, usecols, numeric):
+    """
+    Applies the column conversions of the csv export: text columns B and M, compact numbers and the txtDueDate dates.
+    """
+    # Ensure necessary columns are present
+    required_columns = [c.CSV_DATE_COLUMN]  # Add any other necessary columns here
+    for col in required_columns:
+        if col not in df.columns:
+            raise ValueError(f"Missing required column: {col}")
+
+    # Convert columns B and M to strings 
+    positions = dict(zip(usecols or range(len(df.columns)), df.columns))
+    for col in c.CSV_TEXT_COLUMNS:
+        name = positions.get(column_index_from_string(col) - 1)
+        if name is not None:
+            df[name] = df[name].astype(str).astype(df[name].dtype) if isinstance(df[name].dtype, pd.CategoricalDtype) else df[name].astype(str)
+
+    # Quantities become compact numbers when every value parses, otherwise they stay text for convert_to_numeric
+    for name, kind in numeric.items():
+        text = df[name].str.replace(',', '', regex=False).str.strip()
+        values = pd.to_numeric(text, errors='coerce')
+        if (values.isna() & text.notna() & (text != '')).any():
+            print(f"Column '{name}' kept as text, some values are not numbers.")
+            continue
+        df[name] = values.astype(kind)
 
-        # Convert 'txtDueDate' to datetime
-        df['txtDueDate'] = pd.to_datetime(df['txtDueDate'], format='%d/%m/%Y', errors='coerce', dayfirst=True)
+    # Convert 'txtDueDate' to datetime
+    df[c.CSV_DATE_COLUMN] = pd.to_datetime(df[c.CSV_DATE_COLUMN], format='%d/%m/%Y', errors='coerce', dayfirst=True)
+    return df
 
-        # Save to Excel
-        df.to_excel(output_excel_path, index=False, header=True)
+def load_csv(input_csv_path, columns=None, dtypes=None):
+    """
+    Parses the csv export into a DataFrame. The frame stays in memory for the
+    rest of the openpyxl phase, no intermediate excel file is written.
+
+    Parameters:
+        input_csv_path (str): The path to the csv file.
+        columns (list): Column letters to read (CSV_SCHEMAS), None reads every column.
+        dtypes (dict): Column letter -> compact dtype (CSV_COLUMN_DTYPES).
+
+    Returns:
+        DataFrame: The parsed csv, or None if it could not be loaded.
+    """
+    try:
+        # Load CSV, only the schema columns are parsed 
+        read_options, numeric = csv_read_options(input_csv_path, columns, dtypes)
+        df = convert_csv_types(pd.read_csv(input_csv_path, **read_options), read_options['usecols'], numeric)
 
         # Debugging outputs
-        print(df['txtDueDate'].dtype)
+        print(df[c.CSV_DATE_COLUMN].dtype)
         print(df.dtypes.value_counts())
-        print("CSV converted to Excel successfully.")
+        print(f"CSV loaded successfully ({len(df.columns)} columns).")
+        memory_report(df, 'csv')
         
         return df
         
@@ -34,6 +96,95 @@ def load_and_convert_csv(input_csv_path, output_excel_path):
         print(f"An error occurred: {e}")
         return None
 
+def load_source(columns):
+    """
+    Parses the csv export of a report: the report columns and, with KEEP_RAW_SHEET, the whole export for the hidden Sheet1.
+
+    Parameters:
+        columns (list): Column letters to read (CSV_SCHEMAS).
+
+    Returns:
+        tuple: (DataFrame of the report columns, DataFrame of every column or None)
+
+    Raises:
+        RuntimeError: the export could not be parsed (load_csv printed why), so no failed parse is cached
+    """
+    source_df = load_csv(c.source_file, columns, c.CSV_COLUMN_DTYPES if c.CSV_DTYPE_MODE == 'typed' else None)
+    raw_df = load_csv(c.source_file) if c.KEEP_RAW_SHEET and source_df is not None else None
+    if source_df is None or (c.KEEP_RAW_SHEET and raw_df is None):
+        raise RuntimeError(f"Could not load the csv export '{c.source_file}'")
+    return source_df, raw_df
+
+def source_stage_key(columns):
+    """
+    Returns the stage cache key of load_source(columns): export content, csv config and parsing code.
+    """
+    return stage_key(file_digest(c.source_file), columns, c.CSV_DTYPE_MODE, c.CSV_COLUMN_DTYPES, c.CSV_TEXT_COLUMNS, c.CSV_DATE_COLUMN,
+                     c.KEEP_RAW_SHEET, pipeline_modules())
+
+def select_columns(df, read_columns, columns):
+    """
+    Returns the columns of a report schema from a frame read with more columns (e.g. both report schemas at once),
+    internal columns such as the Source flags are kept at the end.
+
+    Parameters:
+        df (DataFrame): Csv frame read with read_columns.
+        read_columns (list): Column letters df was read with.
+        columns (list): Column letters to keep.
+    """
+    read_positions = sorted(column_index_from_string(col) for col in read_columns)
+    positions = [read_positions.index(column_index_from_string(col)) for col in sorted(columns, key=column_index_from_string)]
+    positions += [idx for idx, name in enumerate(df.columns) if name == c.SOURCE_FLAGS_COLUMN]
+    return df.iloc[:, positions]
+
+def iter_csv(input_csv_path, columns=None, dtypes=None, chunk_rows=c.CSV_CHUNK_ROWS, keep_raw=False):
+    """
+    Parses the csv export chunk_rows rows at a time (chunked streaming mode), with the same column selection and
+    conversions as load_csv.
+
+    Parameters:
+        keep_raw (bool): Also yield every column of the chunk (raw Sheet1, KEEP_RAW_SHEET), the export is then parsed once.
+
+    Yields:
+        tuple: (raw chunk or None, chunk of the columns selected)
+    """
+    read_options, numeric = csv_read_options(input_csv_path, None if keep_raw else columns, dtypes)
+    positions = sorted(column_index_from_string(col) - 1 for col in columns) if columns else None
+    with pd.read_csv(input_csv_path, chunksize=chunk_rows, **read_options) as reader:
+        for chunk_idx, chunk in enumerate(reader, start=1):
+            chunk = convert_csv_types(chunk, read_options['usecols'], numeric)
+            print(f"CSV chunk {chunk_idx} loaded ({len(chunk)} rows).")
+            if not keep_raw:
+                yield None, chunk
+            else:
+                yield chunk, chunk.iloc[:, positions] if positions else chunk
+
+def memory_report(df, label):
+    """
+    Prints the memory used by a frame, in total and per dtype.
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    by_dtype = usage.groupby(df.dtypes.astype(str)).sum()
+    details = ', '.join(f"{dtype} {size / 2**20:.1f} MB" for dtype, size in by_dtype.sort_values(ascending=False).items())
+    print(f"Memory used by the {label} frame: {usage.sum() / 2**20:.1f} MB ({details})")
+
+def widen_floats(values):
+    """
+    Returns float32 data (Series or DataFrame) as float64 holding the decimal values that were read (0.1, not 0.100000001),
+    other data is returned unchanged. Used before float32 quantities are written or summed.
+    """
+    if isinstance(values, pd.DataFrame):
+        float32_columns = [idx for idx, dtype in enumerate(values.dtypes) if dtype == 'float32']
+        if not float32_columns:
+            return values
+        values = values.copy()
+        for idx in float32_columns:
+            values.isetitem(idx, widen_floats(values.iloc[:, idx]))
+        return values
+    if values.dtype == 'float32':
+        return pd.to_numeric(values.astype(str))
+    return values
+
 def load_excel_workbook(file_path):
     """
     Loads an Excel workbook using openpyxl.
@@ -53,6 +204,25 @@ def load_excel_workbook(file_path):
     except Exception as e:
         print(f"An error occurred while loading the workbook: {e}")
 
+def load_sheet_frame(file_path, sheet_name):
+    """
+    Reads one sheet of an Excel file into a DataFrame (first row is the header), cell values are kept as they are.
+
+    Parameters:
+        file_path (str): The path to the Excel file.
+        sheet_name (str): The sheet to read.
+
+    Returns:
+        DataFrame: The sheet data.
+    """
+    wb = load_workbook(file_path, read_only=True)
+    rows = wb[sheet_name].values
+    header = next(rows)
+    df = pd.DataFrame(rows, columns=header)
+    wb.close()
+    print(f"Sheet '{sheet_name}' of '{file_path}' loaded successfully.")
+    return df
+
 def open_excel_with_win32(file_path, visible=False):
     """
     Opens Excel and a single workbook using win32com.
@@ -64,6 +234,9 @@ def open_excel_with_win32(file_path, visible=False):
     Returns:
         tuple: (excel_app, workbook)
     """
+    if gencache is None:
+        raise RuntimeError("win32com is not installed, set PIVOT_BACKEND = 'local' in constants.py to build the report without Excel")
+
     try:
         excel = gencache.EnsureDispatch("Excel.Application")
         excel.Visible = visible
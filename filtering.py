@@ -1,70 +1,76 @@
+import numpy as np
 import pandas as pd
 
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.utils import column_index_from_string
 
-def filter_and_create_sheet(wb, filters, output_sheet_name, source_sheet_name):
+import constants as c
+
+SOURCE_BITS = {category: 1 << bit for bit, category in enumerate(c.SOURCE_CATEGORIES)}
+
+def classify_source(source):
     """
-    Filters data in a worksheet and creates a new sheet with filtered results.
+    Classifies every 'Source' value into SOURCE_CATEGORIES bit flags. The string matching
+    runs once per distinct value and is mapped back to the rows through the factorized codes.
 
     Parameters:
-    - wb: openpyxl Workbook object
-    - source_sheet_name: name of the sheet to filter
-    - filters: list of functions that return True/False given a DataFrame
-    - output_sheet_name: name of the new worksheet to create with filtered results
+    - source: 'Source' column (Series)
+
+    Returns:
+    - ndarray: uint16 flags aligned with source (0 for blanks)
+    """
+    codes, uniques = pd.factorize(source)
+    uniques = pd.Series(uniques, dtype=object).astype(str)
+
+    unique_flags = np.zeros(len(uniques) + 1, dtype=np.uint16) # last slot is used by blanks (code -1)
+    for category, (match, pattern) in c.SOURCE_CATEGORIES.items():
+        if match == 'startswith':
+            hits = uniques.str.startswith(pattern)
+        else:
+            hits = uniques.str.contains(pattern, case=False, regex=False)
+        unique_flags[:-1][hits.to_numpy(dtype=bool)] |= SOURCE_BITS[category]
+
+    print(f"{len(uniques)} distinct Source values classified.")
+    return unique_flags[codes]
+
+def has_source_flag(df, category):
     """
-    ws = wb[source_sheet_name]
-    
-    # Convert worksheet to DataFrame
-    data = ws.values
-    cols = next(data)
-    df = pd.DataFrame(data, columns=cols)
-
-    
-    # If filters is a callable, get actual filters
-    if callable(filters):
-        filters = filters(df)
-
-    # Apply filters
-    for condition in filters:
-        df = df[condition(df)]
-
-    # Remove sheet if it already exists
-    if output_sheet_name in wb.sheetnames:
-        del wb[output_sheet_name]
-
-    # Create new sheet and write the filtered data
-    new_ws = wb.create_sheet(title=output_sheet_name)
-    for r in dataframe_to_rows(df, index=False, header=True):
-        new_ws.append(r)
-
-    print(f"Filtered data written to '{output_sheet_name}' sheet.")
-    return df
-
-def fill_column_based_on_filter(ws, target_col_letter, condition_func, source_col_letter = 'I', label='Y'):
+    Returns a boolean Series marking the rows whose Source falls in the given category.
     """
-    Fill a column with 'Y' based on a filter applied to the Source column.
-
-    Args:
-        ws: The worksheet object.
-        source_col_letter (str): Column letter for 'Source' (e.g., 'I').
-        target_col_letter (str): Column letter to write the 'Y' (e.g., 'P', 'Q', etc.).
-        condition_func (function): A function that takes a cell value and returns True if the row should be updated.
-        label (str): The value to insert in the target column (default 'Y').
+    return (df[c.SOURCE_FLAGS_COLUMN] & SOURCE_BITS[category]) != 0
+
+
+def partition_frame(df, sheet_config):
+    """
+    Routes every row of the source frame to all the outputs it belongs to in a single pass.
+    Each output gets one bit in a per-row route code, so the source frame is built once
+    and every output is a positional take on it, instead of one full filter run per sheet.
+
+    Parameters:
+    - df: source DataFrame (Working / TPR Working frame)
+    - sheet_config: generator function yielding {"name", "filters"} entries, where filters is a
+      list of functions that return True/False given a DataFrame, or a callable returning that list
+
+    Returns:
+    - dict: output sheet name -> filtered DataFrame, in config order
     """
-    source_col_idx = column_index_from_string(source_col_letter)
-    target_col_idx = column_index_from_string(target_col_letter)
+    configs = list(sheet_config())
+    route_codes = np.zeros(len(df), dtype=np.int64)
 
-    updated_rows = 0
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-        source_cell_val = row[source_col_idx - 1].value
-        target_cell = row[target_col_idx - 1]
+    for bit, config in enumerate(configs):
+        filters = config["filters"]
 
-        if condition_func(str(source_cell_val).strip() if source_cell_val else ''):
-                target_cell.value = label
-                updated_rows += 1
+        # If filters is a callable, get actual filters
+        if callable(filters):
+            filters = filters(df)
 
-    print(f"{updated_rows} cells in column {target_col_letter} filled with '{label}'.")
+        mask = np.ones(len(df), dtype=bool)
+        for condition in filters:
+            mask &= condition(df).to_numpy(dtype=bool, na_value=False)
+        route_codes |= mask.astype(np.int64) << bit
 
+    partitions = {}
+    for bit, config in enumerate(configs):
+        positions = np.flatnonzero(route_codes & (1 << bit))
+        partitions[config["name"]] = df.iloc[positions]
 
-     
\ No newline at end of file
+    print(f"Source frame partitioned into {len(partitions)} sheets.")
+    return partitions
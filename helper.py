@@ -1,25 +1,23 @@
-from filtering import filter_and_create_sheet
-from filtering import fill_column_based_on_filter
+from filtering import has_source_flag
+from worksheet_manager import write_frame_to_sheet
 import constants as c 
+import numpy as np
 import pandas as pd 
+from datetime import datetime
+from openpyxl.utils.cell import coordinate_from_string
 
-def create_filtered_sheets(wb,sheet_config, source_sheet_name): # Helper function to filter and create sheets 
-    for config in sheet_config():
-        filter_and_create_sheet(
-            wb=wb,
-            filters=config["filters"],
-            output_sheet_name=config["name"],
-            source_sheet_name = source_sheet_name 
-        )
+def create_filtered_sheets(wb, frames): # Helper function to create the filtered sheets from the partitioned frames 
+    for sheet_name, df in frames.items():
+        write_frame_to_sheet(wb, df, sheet_name)
+        print(f"Filtered data written to '{sheet_name}' sheet.")
+    return frames
 
 def tpr_sheet_config():
     def mrp_filters(df):
-        if 'Due Date' in df.columns:
-            df['Due Date'] = pd.to_datetime(df['Due Date'], errors='coerce', dayfirst=True)
         return [
-            lambda df: df['Source'].str.contains('MRP', na=False, case=False),
-            lambda df: df['Due Date'].dt.year == 2025,
-            lambda df: df['Receipts'].notna() & (df['Receipts'].str.strip() != '')
+            lambda df: has_source_flag(df, 'MRP'),
+            lambda df: pd.to_datetime(df['Due Date'], errors='coerce', dayfirst=True).dt.year == 2025,
+            lambda df: df['Receipts'].notna() & (df['Receipts'].astype(str).str.strip() != '')
         ]
 
     yield {
@@ -30,16 +28,16 @@ def tpr_sheet_config():
     yield {
         "name": "Schedule",
         "filters": [
-            lambda df: df['Source'].str.contains('Job', na=False, case=False),
+            lambda df: has_source_flag(df, 'Job'),
             lambda df: df['Type'] == 'M',
-            lambda df: df['Receipts'].notna() & (df['Receipts'].str.strip() != '')
+            lambda df: df['Receipts'].notna() & (df['Receipts'].astype(str).str.strip() != '')
         ]
     }
 
     yield {
         "name": "TPR Inventory",
         "filters": [
-            lambda df: df['Source'].str.contains('On-Hand Quantity', na=False, case=False)
+            lambda df: has_source_flag(df, 'On-hand Quantity')
         ]
     }
 
@@ -50,50 +48,87 @@ def summary_sheet_config():
     yield {
         "name": "OHS",
         "filters": [
-            lambda df: df['Source'].str.contains('On-hand', na=False, case=False),
+            lambda df: has_source_flag(df, 'On-hand'),
         ]
     }
     yield {
         "name": "MO",
         "filters": [
-            lambda df: df['Source'].str.startswith('Job', na=False,)
+            lambda df: has_source_flag(df, 'Job Start')
         ]
     }
     yield {
         "name": "SO",
         "filters": [
-            lambda df: df['Source'].str.contains('SO:', na=False, case=False)
+            lambda df: has_source_flag(df, 'SO')
         ]
     }
     yield {
         "name": "PO",
         "filters": [
-            lambda df: df['Source'].str.contains('PO:', na=False, case=False),
+            lambda df: has_source_flag(df, 'PO'),
         ]
     }
     yield {
         "name": "Forecast",
         "filters": [
-            lambda df: df['Source'].str.contains('Forecast', na=False, case=False),
+            lambda df: has_source_flag(df, 'Forecast'),
         ]
     }
     yield {
         "name": "Suggestion",
         "filters": [
-            lambda df: df['Source'].str.contains('Suggestion', na=False, case=False),
+            lambda df: has_source_flag(df, 'Suggestion'),
         ]
     }
     print("Filtered sheets created")
 
-def fill_schedule_values(ws):
-    # MRP
-    fill_column_based_on_filter(ws,'Q', lambda val: 'MRP' in val.upper()) # Start from Q because of the 2 extra columns added ("year" and "month" columns) in schedule tab
-    # MO
-    fill_column_based_on_filter(ws,'R', lambda val: val.startswith('Job') and 'MRP' not in val.upper())
-    # Expedite
-    fill_column_based_on_filter(ws,'S', lambda val: 'expedite' in val.lower())
-    # Postpone
-    fill_column_based_on_filter(ws,'T', lambda val: 'postpone' in val.lower())
+def schedule_flags(schedule_df):
+    """
+    Returns the MRP/MO/EXPEDITE/POSTPONE row masks of the Schedule frame (COLUMNS_TO_ADD_SCHEDULE order), from its
+    precomputed Source categories.
+    """
+    mrp = has_source_flag(schedule_df, 'MRP')
+    return dict(zip(c.COLUMNS_TO_ADD_SCHEDULE, [
+        mrp, # MRP
+        has_source_flag(schedule_df, 'Job Start') & ~mrp, # MO
+        has_source_flag(schedule_df, 'Expedite'), # Expedite
+        has_source_flag(schedule_df, 'Postpone'), # Postpone
+    ]))
+
+def schedule_flag_frame(schedule_df, label='Y'):
+    """
+    Returns the MRP/MO/EXPEDITE/POSTPONE flag columns of the Schedule sheet, keyed by column index right after the
+    frame's own columns (streaming output).
+    """
+    first_col = len(schedule_df.columns.drop(c.SOURCE_FLAGS_COLUMN, errors='ignore')) + 1
+    return pd.DataFrame({
+        first_col + offset: np.where(row_mask.to_numpy(dtype=bool, na_value=False), label, None)
+        for offset, row_mask in enumerate(schedule_flags(schedule_df).values())
+    })
+
+def add_schedule_flags(schedule_df, label='Y'):
+    """
+    Returns the Schedule frame with the MRP/MO/EXPEDITE/POSTPONE flag columns (COLUMNS_TO_ADD_SCHEDULE) appended,
+    so the sheet is written with them in one pass instead of inserting and filling columns afterwards.
+    """
+    flags = schedule_flag_frame(schedule_df, label)
+    return schedule_df.assign(**{header: flags[col_idx].to_numpy() for header, col_idx in zip(c.COLUMNS_TO_ADD_SCHEDULE, flags.columns)})
+
+def overdue_formula(first_cell, run_date=None):
+    """
+    Conditional-format formula highlighting the due dates of the Schedule pivot row labels that fall before the run
+    date (Overdue/Late in the legend). Year labels (numbers up to 9999) and text labels are left alone.
+
+    Parameters:
+    - first_cell: top-left cell of the formatted range (e.g. 'X1'), the column is anchored ($X1) and the row is relative
+      to the cell the rule is added from (Excel reads it against the active cell, openpyxl against the range's top-left)
+    - run_date: date the report is run for (default today)
+    """
+    run_date = run_date or datetime.now()
+    column, row = coordinate_from_string(first_cell)
+    ref = f"${column}{row}"
+    return f"AND(ISNUMBER({ref}),{ref}>9999,{ref}<DATE({run_date.year},{run_date.month},{run_date.day}))"
 
 def pivot_table_generator():
     yield{
@@ -120,44 +155,46 @@ def pivot_table_generator():
         'data_field' : [('On Hand','sum')]
     }        
 
-def convert_to_numeric(wb):
+def convert_to_numeric(df, partitions=None, skip_columns=c.NUMERIC_SKIP_COLUMNS):
     """
-    Loops through all sheets in the workbook and converts column values 
-    to numeric types where possible, excluding specific columns.
+    Converts the text columns of the source frame to numeric types where possible,
+    column by column, excluding specific columns. Thousands separators are stripped;
+    values that still cannot be converted are kept as they are.
 
     Parameters:
-    - wb: openpyxl Workbook object
+    - df: source DataFrame (Working / TPR Working frame)
+    - partitions: dict of frames taken from df (partition_frame output), re-taken from the converted frame
+    - skip_columns: columns left untouched
+
+    Returns:
+    - tuple: (converted DataFrame, converted partitions, {column: number of values that failed to convert})
     """
-    skip_columns = ['PartNum','Class','Due Date']
+    converted = {}
+    report = {}
 
-    for sheet_name in wb.sheetnames:
-        if sheet_name == 'Sheet1':
-            print(f"Skipping sheet: {sheet_name}")
+    for col_name in df.columns:
+        values = df[col_name]
+        if col_name in skip_columns or col_name == c.SOURCE_FLAGS_COLUMN:
             continue
-
-        ws = wb[sheet_name]
-        print(f"Processing sheet: {sheet_name}")
-
-        # Get headers from first row
-        headers = [cell.value for cell in ws[1]]
-
-        for col_idx, col_name in enumerate(headers, start=1):
-            if col_name not in skip_columns:
-                for row_idx in range(2, ws.max_row + 1):
-                    cell = ws.cell(row=row_idx, column=col_idx)
-                    try:
-                        if cell.value not in [None, '']:
-                            val = str(cell.value).replace(',', '').strip()
-                            cell.value = float(val)
-                    except ValueError:
-                        continue
-
-    print(f"All sheets updated with numeric conversions (excluding {skip_columns}).")
-
-
-
-
-
-
-
-
+        if isinstance(values.dtype, pd.CategoricalDtype) or not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+            continue # already typed at read time (CSV_DTYPE_MODE = 'typed')
+
+        cleaned = values.str.replace(',', '', regex=False).str.strip()
+        numeric = pd.to_numeric(cleaned, errors='coerce')
+        failed = values.notna() & (values != '') & numeric.isna()
+
+        report[col_name] = int(failed.sum())
+        if report[col_name] == 0:
+            converted[col_name] = numeric.where(values.notna() & (values != ''))
+        else:
+            converted[col_name] = numeric.astype(object).where(numeric.notna(), values.astype(object))
+
+    df = df.assign(**converted)
+    if partitions is not None:
+        partitions = {name: df.loc[part.index] for name, part in partitions.items()}
+
+    for col_name, failures in report.items():
+        if failures:
+            print(f"Column '{col_name}': {failures} values could not be converted to numbers.")
+    print(f"Numeric conversion done for {len(report)} columns (excluding {skip_columns}).")
+    return df, partitions, report
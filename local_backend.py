@@ -0,0 +1,392 @@
+import constants as c
+import pandas as pd
+from datetime import datetime
+from file_handler import widen_floats
+from helper import overdue_formula
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.styles import Alignment
+from openpyxl.styles import Font
+from openpyxl.styles import PatternFill
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_from_string
+
+# Pure-Python replacement for the win32com phase (PIVOT_BACKEND = 'local').
+# Pivot tables are written as static blocks at the same anchors, so the report can be built without Excel.
+
+MONTH_ORDER = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+def read_table_range(wb, table_range):
+    """
+    Reads a pivot source range such as "'Inventory by WH'!$B:$H" into a DataFrame (first row is the header).
+    """
+    sheet_name, columns = table_range.rsplit('!', 1)
+    sheet_name = sheet_name.strip("'")
+    first_col, last_col = [column_index_from_string(col.replace('$', '')) for col in columns.split(':')]
+
+    ws = wb[sheet_name]
+    rows = ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=first_col, max_col=last_col, values_only=True)
+    header = next(rows)
+    return pd.DataFrame(rows, columns=header)
+
+def item_name(value):
+    """
+    Returns the pivot item name of a value the way Excel shows it ('(blank)' for empty cells).
+    """
+    if value is None or value == '' or (not isinstance(value, str) and pd.isna(value)):
+        return '(blank)'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value
+    return str(value)
+
+def item_sort_key(field, name):
+    # Numbers and dates before text, months in calendar order
+    if field == 'Month' and name in MONTH_ORDER:
+        return (0, MONTH_ORDER.index(name), '')
+    if isinstance(name, datetime):
+        return (0, name.timestamp(), '')
+    try:
+        return (0, float(name), '')
+    except ValueError:
+        return (1, 0, name)
+
+def data_field_values(df, field_name, agg_type):
+    """
+    Returns the per-row contribution of a data field: numeric values for 'sum', 1/0 for non-empty cells for 'count'.
+    """
+    values = df[field_name]
+    if agg_type.lower() == 'sum':
+        return widen_floats(pd.to_numeric(values, errors='coerce')).fillna(0)
+    return (values.notna() & (values.astype(str).str.strip() != '')).astype(int)
+
+def pivot_contributions(source_df, row_field, column_field=None, data_field=None, filter_field=None):
+    """
+    Reduces pivot source rows to the data field totals per distinct combination of pivot items
+    (indexed by the row, column and filter fields). Totals of several source chunks can be merged with merge_contributions.
+    """
+    fields = row_field + (column_field or []) + (filter_field or [])
+    df = pd.DataFrame({field: source_df[field].astype(object).map(item_name) for field in fields})
+    for field_name, agg_type in data_field:
+        df[f"{agg_type.capitalize()} of {field_name}"] = data_field_values(source_df, field_name, agg_type)
+    return df.groupby(fields, sort=False).sum()
+
+def merge_contributions(parts):
+    """
+    Merges pivot_contributions of several source chunks into one.
+    """
+    merged = pd.concat(parts)
+    return merged.groupby(level=list(range(merged.index.nlevels)), sort=False).sum()
+
+def build_pivot_block(source_df, row_field, column_field=None, data_field=None, filter_field=None,
+                      filter_items=None, hidden_items=None, expanded_items=None, contributions=None):
+    """
+    Builds a compact-layout pivot table as a grid of rows.
+
+    Parameters:
+    - source_df: pivot source data (not used when contributions are given)
+    - row_field / column_field / data_field / filter_field: same as helper.pivot_table_generator
+    - filter_items: {field: allowed item names} applied to filter fields
+    - hidden_items: {field: item names} hidden from the pivot
+    - expanded_items: {field: item names} whose details are shown, other items of these fields are collapsed
+    - contributions: pivot_contributions already computed (chunked streaming mode)
+
+    Returns:
+    - tuple: (grid rows, number of header rows above the first item, column item names)
+    """
+    filter_items = filter_items or {}
+    hidden_items = hidden_items or {}
+    expanded_items = expanded_items or {}
+    column_field = column_field or []
+    filter_field = filter_field or []
+
+    if contributions is None:
+        contributions = pivot_contributions(source_df, row_field, column_field, data_field, filter_field)
+    df = contributions.reset_index()
+    data_names = [f"{agg_type.capitalize()} of {field_name}" for field_name, agg_type in data_field]
+
+    keep = pd.Series(True, index=df.index)
+    for field, items in filter_items.items():
+        keep &= df[field].isin(items)
+    for field, items in hidden_items.items():
+        if field in df.columns:
+            keep &= ~df[field].isin(items)
+    df = df[keep]
+
+    grid = []
+    for field in filter_field:
+        allowed = filter_items.get(field)
+        if allowed is None:
+            label = '(All)'
+        elif len(allowed) == 1:
+            label = allowed[0]
+        else:
+            label = '(Multiple Items)'
+        grid.append([field, label])
+    if filter_field:
+        grid.append([])
+
+    column_items = []
+    if column_field:
+        # Single data field spread across the column items
+        value_name = data_names[0]
+        column_items = sorted(df[column_field[0]].unique(), key=lambda name: item_sort_key(column_field[0], name))
+        table = df.pivot_table(index=row_field, columns=column_field[0], values=value_name, aggfunc='sum')
+        grid.append([value_name, 'Column Labels'])
+        grid.append(['Row Labels'] + column_items + ['Grand Total'])
+        header_rows = len(grid)
+        row_keys = sorted(table.index, key=lambda name: item_sort_key(row_field[0], name))
+        for key in row_keys:
+            values = [table.at[key, item] if pd.notna(table.at[key, item]) else None for item in column_items]
+            grid.append([key] + values + [sum(value for value in values if value is not None)])
+        totals = [table[item].sum() for item in column_items]
+        grid.append(['Grand Total'] + totals + [sum(totals)])
+        return grid, header_rows, column_items
+
+    # Aggregate once at the deepest level, subtotals are summed from this small frame
+    table = df.groupby(row_field)[data_names].sum()
+    grid.append(['Row Labels'] + data_names)
+    header_rows = len(grid)
+
+    def outline(level, subset):
+        field = row_field[level]
+        items = sorted(subset.index.get_level_values(level).unique(), key=lambda name: item_sort_key(field, name))
+        for item in items:
+            part = subset[subset.index.get_level_values(level) == item]
+            totals = part.sum()
+            grid.append([(item, level)] + [value if value else None for value in totals])
+            expanded = field not in expanded_items or item in expanded_items[field]
+            if level + 1 < len(row_field) and expanded:
+                outline(level + 1, part)
+
+    outline(0, table)
+    totals = table.sum()
+    grid.append(['Grand Total'] + [value if value else None for value in totals])
+    return grid, header_rows, column_items
+
+def block_cells(anchor, grid, header_rows):
+    """
+    Lays out a pivot grid from the anchor cell as {(row, col): (value, style)}. Header rows and the Grand Total row are bold,
+    outline levels are shown with indentation.
+
+    Returns:
+    - tuple: (cells, (first_row, first_col, last_row, last_col) of the block)
+    """
+    col_letter, first_row = coordinate_from_string(anchor)
+    first_col = column_index_from_string(col_letter)
+    last_col = first_col
+    cells = {}
+
+    for row_offset, values in enumerate(grid):
+        for col_offset, value in enumerate(values):
+            style = {}
+            if isinstance(value, tuple):
+                value, level = value
+                if level:
+                    style['alignment'] = Alignment(indent=level)
+            if isinstance(value, datetime):
+                style['number_format'] = 'DD/MM/YYYY'
+            if row_offset == header_rows - 1 or values[0:1] == ['Grand Total']:
+                style['font'] = Font(bold=True)
+            cells[(first_row + row_offset, first_col + col_offset)] = (value, style or None)
+            last_col = max(last_col, first_col + col_offset)
+
+    return cells, (first_row, first_col, first_row + len(grid) - 1, last_col)
+
+def write_cells(ws, cells):
+    """
+    Writes {(row, col): (value, style)} cells into a worksheet.
+    """
+    for (row, col), (value, style) in cells.items():
+        cell = ws.cell(row=row, column=col, value=value)
+        for attr, attr_value in (style or {}).items():
+            setattr(cell, attr, attr_value)
+
+def write_block(ws, anchor, grid, header_rows):
+    """
+    Writes a pivot grid at the anchor cell.
+
+    Returns:
+    - tuple: (first_row, first_col, last_row, last_col) of the written block
+    """
+    cells, extent = block_cells(anchor, grid, header_rows)
+    write_cells(ws, cells)
+    return extent
+
+def range_frame(df, table_range):
+    """
+    Frame version of read_table_range: the columns of a pivot source range such as "MRP!$A:$K".
+    """
+    columns = table_range.rsplit('!', 1)[1]
+    first_col, last_col = [column_index_from_string(col.replace('$', '')) for col in columns.split(':')]
+    return df.iloc[:, first_col - 1:last_col]
+
+def mrp_summary_stats(source_df):
+    """
+    Returns the figures of the MRP summary info: the distinct parts and the largest due date of the pivot source.
+    """
+    parts = source_df.iloc[:, 0]
+    due_dates = pd.to_datetime(source_df.iloc[:, c.due_date_idx - 1], errors='coerce')
+    return {'parts': set(parts[parts.notna() & (parts != '')]), 'largest_due_date': due_dates.max()}
+
+def merge_mrp_stats(stats, other):
+    if stats is None:
+        return other
+    dates = [date for date in (stats['largest_due_date'], other['largest_due_date']) if pd.notna(date)]
+    return {'parts': stats['parts'] | other['parts'], 'largest_due_date': max(dates) if dates else pd.NaT}
+
+def up_till_text(stats):
+    largest_month = stats['largest_due_date']
+    return f"Data shown up till {largest_month.strftime('%b %Y')}" if pd.notna(largest_month) else None
+
+def summary_info_cells(stats, first_col, last_row): # Summary info for the MRP sheet (Total No. of Parts, Data shown up till...)
+    summary_row = last_row + 2 # one blank row below the pivot table
+    style = {'font': Font(bold=True), 'fill': PatternFill(start_color="00B0F0", end_color="00B0F0", fill_type="solid")}
+
+    cells = {
+        (summary_row, first_col): ("Total No. of Parts", style),
+        (summary_row, first_col + 1): (len(stats['parts']), style),
+    }
+
+    if up_till_text(stats):
+        cells[(summary_row + 2, first_col)] = (up_till_text(stats), {'font': Font(bold=True)})
+    return cells
+
+def mrp_summary_names(stats):
+    """
+    Returns the MRP summary info figures as workbook names {name: constant formula} (MRP_SUMMARY_NAMES), for workbooks
+    whose pivot tables are built in Excel: only Excel knows where its PivotTable ends, so the win32com phase writes the
+    cells below it (data_manipulation.write_summary_info).
+    """
+    names = {c.MRP_SUMMARY_NAMES['parts']: str(len(stats['parts']))}
+    if up_till_text(stats):
+        names[c.MRP_SUMMARY_NAMES['up_till']] = '"{}"'.format(up_till_text(stats).replace('"', '""'))
+    return names
+
+def add_defined_names(wb, names):
+    for name, value in names.items():
+        wb.defined_names[name] = DefinedName(name, attr_text=value)
+
+def legend_cells(last_col, first_row=1):
+    """
+    'Legend' (bold) and 'Overdue/Late' (italic) cells beside the pivot table in the schedule sheet.
+    """
+    legend_row = first_row + 2
+    legend_col = last_col + 2
+    return {
+        (legend_row, legend_col): ("Legend", {'font': Font(bold=True, italic=True)}),
+        (legend_row + 1, legend_col): ("Overdue/Late", {'font': Font(italic=True), 'fill': PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")}),
+    }
+
+def overdue_format(first_row, first_col, last_row):
+    """
+    Returns the (range, rule) of the conditional format highlighting overdue dates in the row labels column of the
+    Schedule pivot block: one range-level rule, no per-cell fill.
+    """
+    first_cell = f"{get_column_letter(first_col)}{first_row}"
+    fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+    return f"{first_cell}:{get_column_letter(first_col)}{last_row}", FormulaRule(formula=[overdue_formula(first_cell)], fill=fill)
+
+def write_legend(ws, last_col, first_row=1):
+    write_cells(ws, legend_cells(last_col, first_row))
+    print(f"Legend written at {first_row + 2},{last_col + 2}")
+
+def local_pivot_cells(sheet_name, source_df, pivot_table_location, row_field=None, column_field=None, data_field=None, filter_field=None,
+                      contributions=None, mrp_stats=None):
+    """
+    Builds the pivot block of a sheet and the cells written around it (MRP summary info, Schedule legend).
+    In chunked streaming mode the pivot contributions and MRP stats accumulated over the chunks are passed instead of source_df.
+
+    Returns:
+    - tuple: (cells, dict with the block extent ('first_row', 'first_col', 'last_row', 'last_col'), the visible 'column_items'
+      and the Schedule 'conditional_formats')
+    """
+    current_year = str(datetime.now().year)
+    current_month = datetime.now().strftime("%b")
+
+    grid, header_rows, column_items = build_pivot_block(
+        source_df, row_field, column_field, data_field, filter_field,
+        filter_items=c.PIVOT_FILTER_ITEMS.get(sheet_name),
+        hidden_items=c.PIVOT_HIDDEN_ITEMS.get(sheet_name),
+        expanded_items={'Year': [current_year], 'Month': [current_month]} if sheet_name.strip() == 'Schedule' else None,
+        contributions=contributions
+    )
+    cells, (first_row, first_col, last_row, last_col) = block_cells(pivot_table_location, grid, header_rows)
+
+    pivot = {'first_row': first_row, 'first_col': first_col, 'last_row': last_row, 'last_col': last_col, 'column_items': column_items}
+    if sheet_name.strip() == 'Schedule':
+        cells.update(legend_cells(last_col))
+        pivot['conditional_formats'] = [overdue_format(first_row, first_col, last_row)]
+    if sheet_name.strip() == 'MRP':
+        cells.update(summary_info_cells(mrp_stats or mrp_summary_stats(source_df), first_col, last_row))
+
+    return cells, pivot
+
+def insert_local_pt(wb, sheet_name, table_range, pivot_table_location, row_field=None, column_field=None, data_field=None, filter_field=None):
+    """
+    Local counterpart of data_manipulation.insert_pt, takes the same pivot_table_generator configs.
+
+    Returns:
+    - dict: block extent ('first_row', 'first_col', 'last_row', 'last_col') and the visible 'column_items'
+    """
+    ws = wb[sheet_name]
+
+    if sheet_name.strip() == 'Inventory by WH':
+        ws.delete_cols(1)
+
+    source_df = read_table_range(wb, table_range)
+    cells, pivot = local_pivot_cells(sheet_name, source_df, pivot_table_location, row_field, column_field, data_field, filter_field)
+    write_cells(ws, cells)
+    for cell_range, rule in pivot.get('conditional_formats', []):
+        ws.conditional_formatting.add(cell_range, rule)
+    if sheet_name.strip() == 'MRP':
+        print("Summary info written in mrp sheet.")
+
+    print(f"Pivot table written to '{sheet_name}' at {get_column_letter(pivot['first_col'])}{pivot['first_row']}.")
+    return pivot
+
+def pivot_frame_cells(frames, sheet_name, table_range, pivot_table_location, row_field=None, column_field=None, data_field=None, filter_field=None):
+    """
+    Frame counterpart of insert_local_pt for the streaming output backend: the pivot source is taken from the sheet frames
+    (as written), nothing is read back from a worksheet.
+
+    Returns:
+    - tuple: (cells to write beside the sheet frame, pivot dict as returned by insert_local_pt)
+    """
+    cells, pivot = local_pivot_cells(sheet_name, range_frame(frames[sheet_name], table_range), pivot_table_location,
+                                     row_field, column_field, data_field, filter_field)
+    print(f"Pivot table laid out for '{sheet_name}' at {get_column_letter(pivot['first_col'])}{pivot['first_row']}.")
+    return cells, pivot
+
+def create_TPR_columns(wb, labels, TPR_sheet="TPR Inventory"):
+    """
+    Appends the visible Area labels of the 'Inventory by WH' pivot and the Delta/Total/Delta2 headers to the TPR Inventory sheet.
+    """
+    target_ws = wb[TPR_sheet]
+    last_col = target_ws.max_column
+
+    for idx, label in enumerate(labels):
+        target_ws.cell(row=1, column=last_col + idx + 1).value = label
+
+    offset = len(labels)
+    for i, header in enumerate(c.COLUMNS_TO_ADD_TPR):
+        cell = target_ws.cell(row=1, column=last_col + offset + i + 1)
+        cell.value = header
+        cell.font = Font(bold=True)
+
+    print("Column labels appended successfully.")
+
+def generate_formula_TPR_SUMMARY(wb, sheet_name, formula_map): # Write formulas for TPR and Summary reports with openpyxl
+    ws = wb[sheet_name]
+
+    last_row = ws.max_row
+    while last_row > 1 and ws.cell(row=last_row, column=1).value in (None, ''):
+        last_row -= 1
+
+    for row in range(2, last_row + 1):
+        for col_index_str, formula_template in formula_map.items():
+            ws.cell(row=row, column=int(col_index_str)).value = formula_template.format(row=row)
+
+    print("Formulas written successfully.")
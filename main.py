@@ -1,101 +1,325 @@
 import constants as c
+import local_backend
+import report_writer
 
-from file_handler import load_and_convert_csv
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from file_handler import load_source
+from file_handler import source_stage_key
+from file_handler import iter_csv
 from file_handler import load_excel_workbook
+from file_handler import load_sheet_frame
 from file_handler import open_excel_with_win32
 from file_handler import close_excel_with_win32
 
+from worksheet_manager import header_template_cells
+from worksheet_manager import kept_column_positions
+from worksheet_manager import drop_frame_columns
+from worksheet_manager import prepare_working_frame
 from worksheet_manager import prepare_working_sheet
+from worksheet_manager import write_frame_to_sheet
 from worksheet_manager import adjust_column_width
 from worksheet_manager import copy_header_styles
-from worksheet_manager import remove_unwanted_columns
-from worksheet_manager import create_new_columns
+from worksheet_manager import bold_header_cells
 from worksheet_manager import import_inventory_sheet
 from worksheet_manager import format_due_date
 
-from helper import fill_schedule_values
+from filtering import partition_frame
+
+from helper import add_schedule_flags
+from helper import schedule_flag_frame
 from helper import pivot_table_generator
 from helper import create_filtered_sheets
 from helper import tpr_sheet_config
 from helper import convert_to_numeric
 
 from data_manipulation import fill_blank_due_dates
-from data_manipulation import insert_inventory_formula
+from data_manipulation import year_month_frame
+from data_manipulation import map_inventory_area
 from data_manipulation import insert_pt
 from data_manipulation import create_TPR_columns
 from data_manipulation import generate_formula_TPR_SUMMARY
 
+from aggregation import tpr_area_table
+from aggregation import compute_tpr_area_values
+from aggregation import write_formula_values
+
+from stage_cache import cached_stage
+from stage_cache import file_digest
+from stage_cache import pipeline_modules
+from stage_cache import stage_key
+
+from run_trace import traced_run
+from run_trace import stage
+from run_trace import frame_rows
+
 def main():
+    with traced_run('TPR'):
+        with stage('header workbook'):
+            header_wb = load_excel_workbook(c.header_file)
+        if c.CSV_CHUNK_ROWS:
+            build_report(header_wb) # Chunked streaming mode, the csv is read chunk by chunk while the report is written 
+        else:
+            columns = c.CSV_SCHEMAS['TPR']['columns']
+            source_key = source_stage_key(columns)
+            with stage('csv parse') as record:
+                source_df, raw_df = cached_stage('csv',source_key,lambda: load_source(columns))
+                record['rows_out'] = len(source_df)
+            build_report(header_wb,source_df,raw_df,source_key)
+
+        if c.PIVOT_BACKEND == 'local':
+            return
+        finish_report()
+
+def build_report(header_wb, source_df=None, raw_df=None, source_key=None):
+    """
+    Writes the TPR workbook (openpyxl phase).
+
+    Parameters:
+    - header_wb: loaded header workbook
+    - source_df: csv export read with the TPR schema columns (the Source flags may already be assigned, see main_all.py),
+      None reads the export chunk by chunk (CSV_CHUNK_ROWS)
+    - raw_df: whole csv export kept as hidden Sheet1 (KEEP_RAW_SHEET), or None
+    - source_key: stage cache key of source_df, the stages fed by it are only cached when it is given
+    """
 
 ######################### USING OPENPYXL ############################
 
-    # Convert csv to excel file 
-    load_and_convert_csv(c.source_file,c.dest_file)
+    # Inventory by WH frame, Area mapped from the header workbook (no VLOOKUP needed) 
+    header_key = file_digest(c.header_file)
+    inventory_key = stage_key(file_digest(c.qoh_file),header_key,pipeline_modules())
+    with stage('inventory') as record:
+        inventory_df = cached_stage('inventory',inventory_key,lambda: map_inventory_area(load_sheet_frame(c.qoh_file,'Results'),header_wb['Area']))
+        record['rows_out'] = len(inventory_df)
 
-    # Load workbooks 
-    main_wb = load_excel_workbook(c.dest_file)
-    header_wb = load_excel_workbook(c.header_file)
+    area_table = None
+    if c.TPR_FORMULA_MODE in ('values','both'):
+        area_key = stage_key(inventory_key,c.PIVOT_HIDDEN_ITEMS,pipeline_modules())
+        with stage('tpr area table'):
+            area_table = cached_stage('tpr_area_table',area_key,lambda: tpr_area_table(inventory_df))
 
-    # Working tab 
-    prepare_working_sheet(main_wb,header_wb,'Working','Header', c.COLUMNS_TO_DELETE_WORKING) # Prepare Working tab with header 
-    working_sheet = main_wb['Working']
+    if source_df is None:
+        # Chunked streaming mode, the csv is read, partitioned and written chunk by chunk 
+        schema = c.CSV_SCHEMAS['TPR']
+        chunks = iter_csv(c.source_file,schema['columns'],c.CSV_COLUMN_DTYPES if c.CSV_DTYPE_MODE == 'typed' else None,c.CSV_CHUNK_ROWS,keep_raw=c.KEEP_RAW_SHEET)
+        with stage('tpr chunked stream'):
+            write_streaming_report(((raw_chunk,*prepare_frames(source_chunk,header_wb)) for raw_chunk, source_chunk in chunks),header_wb,inventory_df,area_table,spill=True)
+        return
+
+    frames_key = stage_key('TPR',source_key,header_key,c.CSV_SCHEMAS['TPR'],c.SOURCE_CATEGORIES,c.NUMERIC_SKIP_COLUMNS,c.COLUMNS_TO_DELETE_MRP,
+                           prepare_frames,pipeline_modules())
+    with stage('tpr frames',rows_in=len(source_df)) as record:
+        working_df, frames = cached_stage('tpr_frames',frames_key,lambda: prepare_frames(source_df,header_wb))
+        record['rows_out'] = frame_rows({'Working': working_df, **frames})
+
+    with stage('tpr workbook',backend=c.OUTPUT_BACKEND,rows_out=frame_rows({'Working': working_df, 'Inventory by WH': inventory_df, **frames})):
+        if c.OUTPUT_BACKEND == 'write_only':
+            write_streaming_report([(raw_df,working_df,frames)],header_wb,inventory_df,area_table)
+        else:
+            write_report(raw_df,header_wb,working_df,frames,inventory_df,area_table)
+
+def finish_report():
+
+######################### USING WIN32 LIB ###############################
+
+    # Open excel TPR wb using win32 
+    try:
+        with stage('com open tpr'):
+            excel, wb_main = open_excel_with_win32(c.file_path_win32)
+    except Exception as e:
+        print(f"Failed to open main workbook: {e}")
+        return
 
-    # Prepare all filtered sheets 
-    create_filtered_sheets(main_wb,tpr_sheet_config,'Working')
-    convert_to_numeric(main_wb)
+    # Create pivot tables in 'MRP','Schedule' and 'Inventory by WH' tabs 
+    for config in pivot_table_generator():
+        with stage(f"com pivot {config['sheet_name']}"):
+            insert_pt(wb_main,**config)
 
-    # MRP tab 
-    MRP_sheet = main_wb['MRP']
+    if c.TPR_FORMULA_MODE == 'formulas':
+        with stage('com tpr formulas'):
+            create_TPR_columns(wb_main)
+            generate_formula_TPR_SUMMARY(wb_main,'TPR Inventory',c.formula_map_tpr) # generate formulas for the tpr inventory and summary sheets
+
+    # Save and close excel wb 
+    with stage('com save tpr'):
+        close_excel_with_win32(excel,wb_main) 
+
+def prepare_frames(source_df, header_wb):
+    """
+    Builds the Working frame of the csv rows and routes its rows to 'MRP','Schedule','TPR Inventory'.
+
+    Returns:
+    - tuple: (Working frame, partitioned frames keyed by sheet name)
+    """
+    schema = c.CSV_SCHEMAS['TPR']
+    working_df = prepare_working_frame(source_df,header_wb[schema['header_sheet']],schema['columns'])
+    frames = partition_frame(working_df,tpr_sheet_config)
+    working_df, frames, _ = convert_to_numeric(working_df,frames)
+    frames['MRP'] = drop_frame_columns(frames['MRP'],c.COLUMNS_TO_DELETE_MRP)
+    return working_df, frames
+
+def write_report(raw_df, header_wb, working_df, frames, inventory_df, area_table=None):
+
+######################### USING OPENPYXL ############################
 
-    # Schedule tab
-    schedule_sheet = main_wb['Schedule']
-    fill_blank_due_dates(schedule_sheet)
-    create_new_columns(schedule_sheet,c.COLUMNS_TO_ADD_SCHEDULE)
-    fill_schedule_values(schedule_sheet)
+    main_wb = Workbook()
+    main_wb.remove(main_wb.active)
+    if raw_df is not None:
+        write_frame_to_sheet(main_wb,raw_df,'Sheet1',hidden=True) # Raw export kept as hidden Sheet1 
+
+    # Working tab 
+    schema = c.CSV_SCHEMAS['TPR']
+    prepare_working_sheet(main_wb,header_wb,'Working',schema['header_sheet'],schema['columns'],working_df) # Prepare Working tab with header 
+    working_sheet = main_wb['Working']
+
+    # Prepare all filtered sheets, the Schedule frame gets its flag columns and Year/Month (pivot row fields) before it is written 
+    schedule_df = add_schedule_flags(fill_blank_due_dates(frames['Schedule']))
+    frames = dict(frames,Schedule=schedule_df.assign(**{name: values.to_numpy() for name, values in year_month_frame(schedule_df).items()}))
+    create_filtered_sheets(main_wb,frames)
+    bold_header_cells(main_wb['Schedule'],c.COLUMNS_TO_ADD_SCHEDULE)
 
     # Inventory by WH tab 
-    import_inventory_sheet(c.qoh_file,main_wb)
-    inventory_sheet = main_wb['Inventory by WH']
-    create_new_columns(inventory_sheet,c.COLUMN_TO_ADD_WH,'E')
+    import_inventory_sheet(inventory_df,main_wb)
 
     # Miscellaneous
     copy_header_styles(working_sheet,main_wb,header_row=1)
-    remove_unwanted_columns(MRP_sheet,c.COLUMNS_TO_DELETE_MRP)
+
+    if c.TPR_FORMULA_MODE in ('values','both'):
+        # Area columns computed from the QOH data, no VLOOKUP recalculation needed when the file is opened 
+        area_labels, tpr_values = compute_tpr_area_values(frames['TPR Inventory'],inventory_df,area_table)
+        local_backend.create_TPR_columns(main_wb,area_labels)
+        write_formula_values(main_wb['TPR Inventory'],tpr_values,c.formula_map_tpr if c.TPR_FORMULA_MODE == 'both' else None)
+
+    if c.PIVOT_BACKEND == 'local':
+        build_local_pivots(main_wb)
+    else:
+        store_mrp_summary_info(main_wb,frames['MRP'])
+
     adjust_column_width(main_wb) # Adjust column width so that everything can be seen clearly 
     format_due_date(main_wb,c.due_date_idx) # Format due dates to look like dd/mm/yyyy
     main_wb.save(c.dest_file)
 
-######################### USING WIN32 LIB ###############################
+def write_streaming_report(chunks, header_wb, inventory_df, area_table=None, spill=False):
 
-    # Open excel TPR and Header wb using win32 
-    try:
-        excel, wb_main = open_excel_with_win32(c.file_path_win32)
-    except Exception as e:
-        print(f"Failed to open main workbook: {e}")
-        return
-    
+######################### USING OPENPYXL WRITE-ONLY ######################
+
+    # Every sheet is laid out as frames + extra cells first, then streamed row by row (same sheets as write_report).
+    # chunks yields (raw frame or None, Working frame, partitioned frames) of the whole export at once, or of one csv chunk at
+    # a time in the chunked streaming mode, where the sheet rows are spilled to disk and the pivots are accumulated chunk by chunk
+    schema = c.CSV_SCHEMAS['TPR']
+    header_cells = header_template_cells(header_wb[schema['header_sheet']],schema['columns'])
+    mrp_header_cells = [header_cells[idx] for idx in kept_column_positions(len(header_cells),c.COLUMNS_TO_DELETE_MRP)] # MRP header follows the columns left in the MRP frame 
+    # Pivot blocks laid out locally, the MRP summary info figures are accumulated for both pivot backends 
+    pivot_configs = {config['sheet_name']: config for config in pivot_table_generator() if c.PIVOT_BACKEND == 'local'}
+    mrp_range = next(config['table_range'] for config in pivot_table_generator() if config['sheet_name'] == 'MRP')
+
+    def sheet_spec(name, df, template_cells=header_cells):
+        header, header_styles = report_writer.template_header(df.drop(columns=[c.SOURCE_FLAGS_COLUMN]),template_cells)
+        return {'name': name, 'df': df, 'header': header, 'header_styles': header_styles, 'date_col': c.due_date_idx}
+
+    # Inventory by WH tab, the QOH data is not chunked 
+    inventory_spec = {
+        'name': 'Inventory by WH',
+        'df': inventory_df.iloc[:, 1:] if c.PIVOT_BACKEND == 'local' else inventory_df, # column A is removed before the pivot
+        'date_col': c.due_date_idx
+    }
+
+    if c.TPR_FORMULA_MODE in ('values','both') and area_table is None:
+        area_table = tpr_area_table(inventory_df)
+    if 'Inventory by WH' in pivot_configs:
+        inventory_spec['cells'], pivot = local_backend.pivot_frame_cells({'Inventory by WH': inventory_spec['df']},**pivot_configs['Inventory by WH'])
+        if c.TPR_FORMULA_MODE == 'formulas':
+            area_table = (pivot['column_items'], None)
+
+    store = report_writer.open_chunk_store(spill)
+    layouts = {}
+    contributions = {}
+    mrp_stats = None
     try:
-        _, wb_header = open_excel_with_win32(c.header_path_win32)
-    except Exception as e:
-        print(f"Failed to open header workbook: {e}")
-        return
+        for raw_df, working_df, frames in chunks:
+            if raw_df is not None:
+                report_writer.add_chunk(store,'Sheet1',raw_df) # Raw export kept as hidden Sheet1 
+                layouts.setdefault('Sheet1',{'name': 'Sheet1', 'header': list(raw_df.columns), 'hidden': True, 'date_col': c.due_date_idx})
 
-    if wb_header is None:
-        print("Header workbook is None — cannot proceed.")
-        return
+            specs = {'Working': sheet_spec('Working',working_df)}
+            for sheet_name, df in frames.items():
+                specs[sheet_name] = sheet_spec(sheet_name,df,mrp_header_cells if sheet_name == 'MRP' else header_cells)
 
-    # Insert 'Inventory by WH' formula
-    insert_inventory_formula(wb_main,wb_header)
+            # Schedule tab, Year/Month (pivot row fields) follow the flag columns 
+            specs['Schedule']['df'] = fill_blank_due_dates(frames['Schedule'])
+            year_month_df = year_month_frame(specs['Schedule']['df'])
+            report_writer.append_columns(specs['Schedule'],schedule_flag_frame(frames['Schedule']),c.COLUMNS_TO_ADD_SCHEDULE,[report_writer.BOLD_STYLE] * len(c.COLUMNS_TO_ADD_SCHEDULE))
+            first_col = len(report_writer.spec_header(specs['Schedule'])) + 1
+            report_writer.append_columns(specs['Schedule'],year_month_df.set_axis(range(first_col,first_col + len(year_month_df.columns)),axis=1),list(year_month_df.columns))
 
-    # Create pivot tables in 'MRP','Schedule' and 'Inventory by WH' tabs 
+            # TPR Inventory tab, the formula columns are left to the win32 phase when pivots are built in Excel 
+            if area_table is not None:
+                area_labels = area_table[0]
+                if c.TPR_FORMULA_MODE in ('values','both'):
+                    _, tpr_values = compute_tpr_area_values(frames['TPR Inventory'],inventory_df,area_table)
+                else:
+                    tpr_values = report_writer.formula_columns(c.formula_map_tpr,len(frames['TPR Inventory']),report_writer.stored_rows(store,'TPR Inventory') + 2)
+                report_writer.append_columns(
+                    specs['TPR Inventory'],tpr_values,
+                    list(area_labels) + c.COLUMNS_TO_ADD_TPR,[None] * len(area_labels) + [report_writer.BOLD_STYLE] * len(c.COLUMNS_TO_ADD_TPR)
+                )
+                if c.TPR_FORMULA_MODE == 'both':
+                    report_writer.add_header_comments(specs['TPR Inventory'],c.formula_map_tpr)
+
+            # Pivot totals of the chunk, merged with the earlier chunks 
+            for sheet_name in ('MRP','Schedule'):
+                if sheet_name not in pivot_configs:
+                    continue
+                config = pivot_configs[sheet_name]
+                source = local_backend.range_frame(report_writer.named_frame(specs[sheet_name]),config['table_range'])
+                part = local_backend.pivot_contributions(source,config.get('row_field'),config.get('column_field'),config.get('data_field'),config.get('filter_field'))
+                contributions[sheet_name] = local_backend.merge_contributions([contributions[sheet_name],part]) if sheet_name in contributions else part
+            mrp_source = local_backend.range_frame(report_writer.named_frame(specs['MRP']),mrp_range)
+            mrp_stats = local_backend.merge_mrp_stats(mrp_stats,local_backend.mrp_summary_stats(mrp_source))
+
+            for sheet_name, spec in specs.items():
+                report_writer.add_chunk(store,sheet_name,spec['df'])
+                layouts.setdefault(sheet_name,{key: value for key, value in spec.items() if key != 'df'})
+
+        # MRP and Schedule pivot blocks from the accumulated totals 
+        for sheet_name, config in pivot_configs.items():
+            if sheet_name in contributions:
+                layouts[sheet_name]['cells'], pivot = local_backend.local_pivot_cells(
+                    sheet_name,None,config['pivot_table_location'],
+                    config.get('row_field'),config.get('column_field'),config.get('data_field'),config.get('filter_field'),
+                    contributions=contributions[sheet_name],mrp_stats=mrp_stats
+                )
+                layouts[sheet_name]['conditional_formats'] = pivot.get('conditional_formats',[])
+                print(f"Pivot table laid out for '{sheet_name}' at {get_column_letter(pivot['first_col'])}{pivot['first_row']}.")
+
+        sheet_order = ['Sheet1','Working','Inventory by WH','MRP','Schedule','TPR Inventory']
+        specs = [inventory_spec if name == 'Inventory by WH' else report_writer.stored_spec(store,**layouts[name])
+                 for name in sheet_order if name in layouts or name == 'Inventory by WH']
+        # With Excel pivot tables, the MRP summary info is written below the pivot in the win32 phase 
+        names = local_backend.mrp_summary_names(mrp_stats) if c.PIVOT_BACKEND != 'local' and mrp_stats is not None else None
+        report_writer.write_only_workbook(c.dest_file,specs,names)
+    finally:
+        report_writer.close_chunk_store(store)
+
+def build_local_pivots(main_wb):
+
+######################### USING PANDAS (no Excel) ########################
+
+    # Write static pivot tables in 'MRP','Schedule' and 'Inventory by WH' tabs 
+    pivots = {}
     for config in pivot_table_generator():
-        insert_pt(wb_main,**config)
+        pivots[config['sheet_name']] = local_backend.insert_local_pt(main_wb,**config)
 
-    create_TPR_columns(wb_main)
-    generate_formula_TPR_SUMMARY(wb_main,'TPR Inventory',c.formula_map_tpr) # generate formulas for the tpr inventory and summary sheets
+    if c.TPR_FORMULA_MODE == 'formulas':
+        local_backend.create_TPR_columns(main_wb,pivots['Inventory by WH']['column_items'])
+        local_backend.generate_formula_TPR_SUMMARY(main_wb,'TPR Inventory',c.formula_map_tpr)
 
-    # Save and close excel wb 
-    close_excel_with_win32(excel,wb_main) 
+def store_mrp_summary_info(main_wb, mrp_df):
+    # Total No. of Parts and Data shown up till from the MRP frame, kept as workbook names until the win32 phase writes them below the pivot (no COM reads)
+    config = next(config for config in pivot_table_generator() if config['sheet_name'] == 'MRP')
+    stats = local_backend.mrp_summary_stats(local_backend.range_frame(mrp_df,config['table_range']))
+    local_backend.add_defined_names(main_wb,local_backend.mrp_summary_names(stats))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import constants as c
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl.utils import column_index_from_string
+
+from file_handler import load_source
+from file_handler import load_excel_workbook
+from file_handler import select_columns
+from file_handler import source_stage_key
+
+from filtering import classify_source
+
+from main import build_report
+from main import finish_report
+from main_summary import build_summary
+from main_summary import finish_summary
+
+from stage_cache import cached_stage
+from stage_cache import pipeline_modules
+from stage_cache import stage_key
+
+from run_trace import traced_run
+from run_trace import stage
+from run_trace import take_records
+from run_trace import add_records
+
+def shared_source():
+    """
+    Parses the csv export once for both reports (union of the TPR and Summary schema columns) and classifies
+    its Source column, each report then takes its own schema columns from this frame.
+
+    Returns:
+    - tuple: ({report: DataFrame of its schema columns with the Source flags}, raw export frame or None, stage cache key)
+    """
+    read_columns = sorted(set(c.CSV_SCHEMAS['TPR']['columns']) | set(c.CSV_SCHEMAS['Summary']['columns']), key=column_index_from_string)
+
+    def parse():
+        source_df, raw_df = load_source(read_columns)
+        source = source_df.iloc[:, read_columns.index(c.CSV_SOURCE_COLUMN)]
+        source_df = source_df.assign(**{c.SOURCE_FLAGS_COLUMN: classify_source(source)})
+        return {report: select_columns(source_df, read_columns, schema['columns']) for report, schema in c.CSV_SCHEMAS.items()}, raw_df
+
+    key = stage_key(source_stage_key(read_columns), c.CSV_SCHEMAS, c.CSV_SOURCE_COLUMN, c.SOURCE_CATEGORIES, shared_source, pipeline_modules())
+    return (*cached_stage('shared_csv', key, parse), key)
+
+def run_build(build, *args):
+    """
+    Runs a report build in a worker process and returns the stages it traced.
+    """
+    take_records() # stages inherited from the parent process (fork) are not the worker's
+    with stage('worker build'): # CPU time and peak RSS of the whole worker, added to the run total
+        build(*args)
+    return take_records()
+
+def apply_constants(values):
+    """
+    Applies the parent's constants to a worker process (spawned workers re-import constants.py and would miss
+    values set at run time, e.g. by benchmark.py).
+    """
+    for name, value in values.items():
+        setattr(c, name, value)
+
+def main_all(finish=True, header_wb=None):
+    """
+    Builds the TPR and TPR Summary workbooks from one parse of the csv export (same output as running main.py then
+    main_summary.py). Both workbooks are built and saved side by side in REPORT_WORKERS processes, the win32com
+    phases then run one after the other in this process (one Excel instance).
+
+    Parameters:
+    - finish: run the win32com phases (main_batch.py runs them afterwards, one snapshot at a time)
+    - header_wb: header workbook already loaded (main_watch.py keeps it in memory), else header_file is loaded
+    """
+    with traced_run('All'):
+        start = time.perf_counter()
+        if header_wb is None:
+            with stage('header workbook'):
+                header_wb = load_excel_workbook(c.header_file)
+        if c.CSV_CHUNK_ROWS:
+            sources, raw_df, source_key = {'TPR': None, 'Summary': None}, None, None # Chunked streaming mode, each report streams the csv chunks itself
+        else:
+            with stage('shared csv parse') as record:
+                sources, raw_df, source_key = shared_source()
+                record['rows_out'] = {report: len(df) for report, df in sources.items()}
+
+        jobs = [('TPR', build_report, sources['TPR']), ('Summary', build_summary, sources['Summary'])]
+        with stage('report builds',workers=c.REPORT_WORKERS):
+            if c.REPORT_WORKERS > 1:
+                constants = {name: value for name, value in vars(c).items() if not name.startswith('__')}
+                with ProcessPoolExecutor(max_workers=min(c.REPORT_WORKERS, len(jobs)), initializer=apply_constants, initargs=(constants,)) as pool:
+                    futures = {report: pool.submit(run_build, build, header_wb, source_df, raw_df, source_key) for report, build, source_df in jobs}
+                    for report, future in futures.items():
+                        add_records(future.result(), report=report) # re-raises an error of the worker
+            else:
+                for report, build, source_df in jobs:
+                    build(header_wb, source_df, raw_df, source_key)
+        print(f"TPR and TPR Summary workbooks written in {time.perf_counter() - start:.1f}s.")
+
+        if finish:
+            finish_all()
+
+def finish_all():
+    """
+    Runs the win32com phases of both workbooks (pivot tables, formulas), nothing with the local pivot backend.
+    """
+    if c.PIVOT_BACKEND == 'local':
+        return
+    finish_report()
+    if c.SUMMARY_FORMULA_MODE == 'formulas':
+        finish_summary()
+
+if __name__ == "__main__":
+    main_all()
@@ -0,0 +1,155 @@
+import constants as c
+import json
+import os
+import re
+import sys
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from main_all import apply_constants
+from main_all import main_all
+from main_all import finish_all
+
+try:
+    import resource
+except ImportError: # Windows, the worker memory cap is not applied
+    resource = None
+
+def find_snapshots(folder=None):
+    """
+    Pairs every csv export found under folder (BATCH_SOURCE_DIR, sub folders included) with the Quantity on hand file
+    of the same folder and day taken closest to it ('20250428_0810H, ...' with '20250428_0811H, ...').
+
+    Returns:
+    - list of dict: name, source_file, qoh_file (None when the day has no Quantity on hand file) and header_file
+      (the folder's 'TPR HEADER.xlsx', else header_file)
+    """
+    folder = folder or c.BATCH_SOURCE_DIR
+    csv_pattern, qoh_pattern = re.compile(c.BATCH_CSV_PATTERN), re.compile(c.BATCH_QOH_PATTERN)
+    snapshots = []
+    for dir_path, _, file_names in sorted(os.walk(folder)):
+        qoh_files = [(match.group(1), int(match.group(2)), name) for name in file_names if (match := qoh_pattern.match(name))]
+        header_file = os.path.join(dir_path, os.path.basename(c.header_file))
+        site = os.path.relpath(dir_path, folder)
+        for name in sorted(file_names):
+            match = csv_pattern.match(name)
+            if not match:
+                continue
+            day, stamp = match.group(1), int(match.group(2))
+            same_day = [(abs(qoh_stamp - stamp), qoh_name) for qoh_day, qoh_stamp, qoh_name in qoh_files if qoh_day == day]
+            snapshots.append({
+                'name': f"{match.group(1)}_{match.group(2)}H" if site == '.' else f"{site}/{match.group(1)}_{match.group(2)}H",
+                'source_file': os.path.join(dir_path, name),
+                'qoh_file': os.path.join(dir_path, min(same_day)[1]) if same_day else None,
+                'header_file': header_file if os.path.exists(header_file) else c.header_file,
+            })
+    return snapshots
+
+def snapshot_settings(snapshot, dest_root=None):
+    """
+    Returns the constants of one snapshot run: its input files, and its workbooks and run report in its own folder of
+    dest_root (BATCH_DEST_DIR).
+    """
+    dest_dir = os.path.join(dest_root or c.BATCH_DEST_DIR, snapshot['name'])
+    dest_file = os.path.join(dest_dir, os.path.basename(c.dest_file))
+    dest_summary_file = os.path.join(dest_dir, os.path.basename(c.dest_summary_file))
+    return {
+        'source_file': snapshot['source_file'],
+        'qoh_file': snapshot['qoh_file'],
+        'header_file': snapshot['header_file'],
+        'dest_file': dest_file,
+        'dest_summary_file': dest_summary_file,
+        'file_path_win32': os.path.abspath(dest_file),
+        'file_path_summary_win32': os.path.abspath(dest_summary_file),
+        'RUN_REPORT_FILE': os.path.join(dest_dir, os.path.basename(c.RUN_REPORT_FILE)),
+        'PROFILE_FILE': os.path.join(dest_dir, os.path.basename(c.PROFILE_FILE)),
+        'REPORT_WORKERS': 1, # the snapshots already use every worker
+    }
+
+def init_worker(constants):
+    apply_constants(constants)
+    if resource is not None and c.BATCH_WORKER_MEMORY_MB:
+        limit = c.BATCH_WORKER_MEMORY_MB * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit)) # going over raises MemoryError in this worker only
+
+def build_snapshot(snapshot):
+    """
+    Builds both workbooks of one snapshot in a worker process (openpyxl phase, the win32com phases run afterwards).
+
+    Returns:
+    - dict: snapshot name, status ('ok' or the error), wall time and the traceback of a failure
+    """
+    start = time.perf_counter()
+    result = {'name': snapshot['name'], 'source_file': snapshot['source_file'], 'qoh_file': snapshot['qoh_file']}
+    try:
+        if snapshot['qoh_file'] is None:
+            raise FileNotFoundError(f"No Quantity on hand file for '{snapshot['source_file']}'")
+        settings = snapshot_settings(snapshot)
+        apply_constants(settings)
+        os.makedirs(os.path.dirname(settings['dest_file']), exist_ok=True)
+        main_all(finish=False)
+        result['status'] = 'ok'
+    except MemoryError:
+        result['status'] = f"error: over the {c.BATCH_WORKER_MEMORY_MB} MB worker memory cap"
+    except Exception as e:
+        result['status'] = f"error: {e}"
+        result['traceback'] = traceback.format_exc()
+    result['wall_s'] = round(time.perf_counter() - start, 3)
+    return result
+
+def write_batch_summary(results, started):
+    """
+    Prints the outcome of every snapshot and writes them to BATCH_DEST_DIR/batch_summary.json.
+    """
+    failed = [result for result in results if result['status'] != 'ok']
+    print(f"\nBatch of {len(results)} snapshots: {len(results) - len(failed)} built, {len(failed)} failed.")
+    for result in results:
+        print(f"  {result['name']:<40} {result.get('wall_s', 0):>8.1f}s  {result['status']}")
+
+    os.makedirs(c.BATCH_DEST_DIR, exist_ok=True)
+    path = os.path.join(c.BATCH_DEST_DIR, 'batch_summary.json')
+    with open(path, 'w') as f:
+        json.dump({'started': started.isoformat(timespec='seconds'), 'snapshots': len(results), 'failed': len(failed), 'results': results}, f, indent=2)
+    print(f"Batch summary written to '{path}'.")
+
+def main_batch(folder=None):
+    """
+    Builds the TPR and TPR Summary workbooks of every snapshot found under folder (BATCH_SOURCE_DIR) in BATCH_WORKERS
+    processes. A failing snapshot does not stop the others; the win32com phases of the built snapshots then run one
+    at a time in this process (one Excel instance).
+    """
+    started = datetime.now()
+    snapshots = find_snapshots(folder)
+    print(f"{len(snapshots)} snapshots found under '{folder or c.BATCH_SOURCE_DIR}'.")
+    if not snapshots:
+        return
+
+    constants = {name: value for name, value in vars(c).items() if not name.startswith('__')}
+    options = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {} # a fresh process per snapshot returns its memory
+    results = {}
+    with ProcessPoolExecutor(max_workers=c.BATCH_WORKERS, initializer=init_worker, initargs=(constants,), **options) as pool:
+        futures = {snapshot['name']: pool.submit(build_snapshot, snapshot) for snapshot in snapshots}
+        for snapshot in snapshots:
+            try:
+                results[snapshot['name']] = futures[snapshot['name']].result()
+            except Exception as e: # a worker was killed, the snapshots still queued in the broken pool fail too
+                results[snapshot['name']] = {'name': snapshot['name'], 'source_file': snapshot['source_file'], 'status': f"error: worker stopped ({e})"}
+            print(f"Snapshot '{snapshot['name']}': {results[snapshot['name']]['status']}")
+
+    if c.PIVOT_BACKEND != 'local':
+        for snapshot in snapshots:
+            if results[snapshot['name']]['status'] == 'ok':
+                apply_constants({**constants, **snapshot_settings(snapshot)})
+                try:
+                    finish_all()
+                except Exception as e:
+                    results[snapshot['name']]['status'] = f"error: win32com phase failed ({e})"
+        apply_constants(constants)
+
+    write_batch_summary([results[snapshot['name']] for snapshot in snapshots], started)
+
+if __name__ == "__main__":
+    main_batch(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,42 +1,144 @@
 import constants as c
+import local_backend
+import report_writer
 
+from openpyxl import Workbook
+
+from worksheet_manager import header_template_cells
+from worksheet_manager import prepare_working_frame
 from worksheet_manager import prepare_working_sheet
+from worksheet_manager import write_frame_to_sheet
 from worksheet_manager import adjust_column_width
 from worksheet_manager import copy_header_styles
 from worksheet_manager import create_summary_sheet
 from worksheet_manager import create_new_columns
 from worksheet_manager import format_due_date
 
-from file_handler import load_and_convert_csv
+from file_handler import load_source
+from file_handler import source_stage_key
+from file_handler import iter_csv
 from file_handler import load_excel_workbook
 from file_handler import open_excel_with_win32
 from file_handler import close_excel_with_win32
 
+from filtering import partition_frame
+
 from helper import create_filtered_sheets
 from helper import summary_sheet_config
 from helper import convert_to_numeric
 
 from data_manipulation import generate_formula_TPR_SUMMARY
 
+from aggregation import summary_totals
+from aggregation import compute_summary_values
+from aggregation import write_formula_values
+
+from stage_cache import cached_stage
+from stage_cache import file_digest
+from stage_cache import pipeline_modules
+from stage_cache import stage_key
+
+from run_trace import traced_run
+from run_trace import stage
+from run_trace import frame_rows
+
 def main_summary():
+    with traced_run('Summary'):
+        with stage('header workbook'):
+            header_wb = load_excel_workbook(c.header_file)
+        if c.CSV_CHUNK_ROWS:
+            build_summary(header_wb) # Chunked streaming mode, the csv is read chunk by chunk while the report is written 
+        else:
+            columns = c.CSV_SCHEMAS['Summary']['columns']
+            source_key = source_stage_key(columns)
+            with stage('csv parse') as record:
+                source_df, raw_df = cached_stage('csv',source_key,lambda: load_source(columns))
+                record['rows_out'] = len(source_df)
+            build_summary(header_wb,source_df,raw_df,source_key)
+
+        if c.PIVOT_BACKEND == 'local' or c.SUMMARY_FORMULA_MODE in ('values','both'):
+            return
+        finish_summary()
+
+def build_summary(header_wb, source_df=None, raw_df=None, source_key=None):
+    """
+    Writes the TPR Summary workbook (openpyxl phase), see main.build_report for the parameters.
+    """
 
 ######################### USING OPENPYXL ########################
 
-    # Convert csv to excel file 
-    load_and_convert_csv(c.source_file,c.dest_summary_file)
+    if source_df is None:
+        # Chunked streaming mode, the csv is read, partitioned and written chunk by chunk 
+        schema = c.CSV_SCHEMAS['Summary']
+        chunks = iter_csv(c.source_file,schema['columns'],c.CSV_COLUMN_DTYPES if c.CSV_DTYPE_MODE == 'typed' else None,c.CSV_CHUNK_ROWS,keep_raw=c.KEEP_RAW_SHEET)
+        with stage('summary chunked stream'):
+            write_streaming_summary(((raw_chunk,*prepare_summary_frames(source_chunk,header_wb)) for raw_chunk, source_chunk in chunks),header_wb,spill=True)
+        return
+
+    frames_key = stage_key('Summary',source_key,file_digest(c.header_file),c.CSV_SCHEMAS['Summary'],c.SOURCE_CATEGORIES,c.NUMERIC_SKIP_COLUMNS,
+                           prepare_summary_frames,pipeline_modules())
+    with stage('summary frames',rows_in=len(source_df)) as record:
+        working_df, frames = cached_stage('summary_frames',frames_key,lambda: prepare_summary_frames(source_df,header_wb))
+        record['rows_out'] = frame_rows({'TPR Working': working_df, **frames})
+
+    totals = None
+    if c.SUMMARY_FORMULA_MODE in ('values','both'):
+        totals_key = stage_key(frames_key,c.summary_aggregations,pipeline_modules())
+        with stage('summary totals'):
+            totals = cached_stage('summary_totals',totals_key,lambda: summary_totals(frames))
+
+    with stage('summary workbook',backend=c.OUTPUT_BACKEND,rows_out=frame_rows({'TPR Working': working_df, 'Summary': frames['OHS'], **frames})):
+        if c.OUTPUT_BACKEND == 'write_only':
+            write_streaming_summary([(raw_df,working_df,frames)],header_wb,totals)
+        else:
+            write_summary(raw_df,header_wb,working_df,frames,totals)
+
+def finish_summary():
+
+######################### USING WIN32 LIB ########################
+
+    # Open excel wb using win32 
+    with stage('com open summary'):
+        excel,wb = open_excel_with_win32(c.file_path_summary_win32)
+        summary_sheet = wb.Sheets("Summary")
+
+    with stage('com summary formulas'):
+        generate_formula_TPR_SUMMARY(wb,'Summary',c.formula_map_summary)
+
+    # Save and close excel wb 
+    with stage('com save summary'):
+        close_excel_with_win32(excel,wb)
+
+def prepare_summary_frames(source_df, header_wb):
+    """
+    Builds the TPR Working frame of the csv rows and routes its rows to 'OHS','MO','SO','PO','Forecast','Suggestion'.
+
+    Returns:
+    - tuple: (TPR Working frame, partitioned frames keyed by sheet name)
+    """
+    schema = c.CSV_SCHEMAS['Summary']
+    working_df = prepare_working_frame(source_df,header_wb[schema['header_sheet']],schema['columns'])
+    frames = partition_frame(working_df,summary_sheet_config)
+    working_df, frames, _ = convert_to_numeric(working_df,frames)
+    return working_df, frames
+
+def write_summary(raw_df, header_wb, working_df, frames, totals=None):
 
-    # Load workbooks 
-    main_wb = load_excel_workbook(c.dest_summary_file)
-    header_wb = load_excel_workbook(c.header_file)
+######################### USING OPENPYXL ########################
+
+    main_wb = Workbook()
+    main_wb.remove(main_wb.active)
+    if raw_df is not None:
+        write_frame_to_sheet(main_wb,raw_df,'Sheet1',hidden=True) # Raw export kept as hidden Sheet1 
 
     # Prepare TPR Working sheet 
-    prepare_working_sheet(main_wb,header_wb,'TPR Working','SummaryHeader',c.COLUMNS_TO_DELETE_SUMMARY_WORKING) # Prepare Working tab with header 
+    schema = c.CSV_SCHEMAS['Summary']
+    prepare_working_sheet(main_wb,header_wb,'TPR Working',schema['header_sheet'],schema['columns'],working_df) # Prepare Working tab with header 
     tpr_working_sheet = main_wb['TPR Working']
 
     # Prepare all filtered sheets ('OHS','MO','SO','PO','Forecast','Suggestion')
-    create_filtered_sheets(main_wb,summary_sheet_config,'TPR Working')
+    create_filtered_sheets(main_wb,frames)
     create_summary_sheet(main_wb)
-    convert_to_numeric(main_wb)
 
     # Summary sheet 
     summary_sheet = main_wb['Summary']
@@ -46,19 +148,98 @@ def main_summary():
     adjust_column_width(main_wb)
     create_new_columns(summary_sheet,c.COLUMNS_TO_ADD_SUMMARY)
     format_due_date(main_wb,c.due_date_idx_summary)
+
+    if c.SUMMARY_FORMULA_MODE in ('values','both'):
+        # SUMIFS columns computed with keyed groupbys, no recalculation needed when the file is opened 
+        summary_values = compute_summary_values(frames['OHS'],frames,totals)
+        write_formula_values(summary_sheet,summary_values,c.formula_map_summary if c.SUMMARY_FORMULA_MODE == 'both' else None)
+    elif c.PIVOT_BACKEND == 'local':
+        local_backend.generate_formula_TPR_SUMMARY(main_wb,'Summary',c.formula_map_summary)
     
     main_wb.save(c.dest_summary_file)
 
-######################### USING WIN32 LIB ########################
-
-    # Open excel wb using win32 
-    excel,wb = open_excel_with_win32(c.file_path_summary_win32)
-    summary_sheet = wb.Sheets("Summary")
-
-    generate_formula_TPR_SUMMARY(wb,'Summary',c.formula_map_summary)
-
-    # Save and close excel wb 
-    close_excel_with_win32(excel,wb)
+def summary_spec(ohs_df, summary_values):
+    """
+    Lays out Summary rows from OHS rows: columns A to G and P copied (H renamed 'On-hand Stock'), then the
+    new Summary columns from I (one column is skipped after 'Suggestion') holding summary_values.
+    """
+    ohs_df = ohs_df.drop(columns=[c.SOURCE_FLAGS_COLUMN])
+    summary_df = ohs_df.iloc[:, [col_idx - 1 for col_idx in c.COLUMNS_TO_COPY_SUMMARY]]
+    summary = {
+        'name': 'Summary',
+        'df': summary_df,
+        'header': list(summary_df.columns[:-1]) + ['On-hand Stock'], # Column H renamed to 'On-hand Stock'
+        'header_styles': [report_writer.header_style()] * len(summary_df.columns)
+    }
+
+    headers = list(c.COLUMNS_TO_ADD_SUMMARY)
+    headers.insert(headers.index('Suggestion') + 1, None)
+    report_writer.append_columns(summary,summary_values,headers,[None if header is None else report_writer.BOLD_STYLE for header in headers])
+    if c.SUMMARY_FORMULA_MODE == 'both':
+        report_writer.add_header_comments(summary,c.formula_map_summary)
+    return summary
+
+def summary_column_values(ohs_df, totals, first_row=2):
+    if c.SUMMARY_FORMULA_MODE in ('values','both'):
+        return compute_summary_values(ohs_df,None,totals)
+    if c.PIVOT_BACKEND == 'local':
+        return report_writer.formula_columns(c.formula_map_summary,len(ohs_df),first_row)
+    return report_writer.formula_columns({},len(ohs_df)) # formulas written in the win32 phase
+
+def write_streaming_summary(chunks, header_wb, totals=None, spill=False):
+
+######################### USING OPENPYXL WRITE-ONLY ######################
+
+    # Same sheets as write_summary, laid out as frames and streamed row by row. chunks yields (raw frame or None, TPR Working
+    # frame, partitioned frames) of the whole export at once, or of one csv chunk at a time in the chunked streaming mode, where
+    # the sheet rows are spilled to disk and the SUMIFS totals are accumulated chunk by chunk before the Summary rows are laid out
+    schema = c.CSV_SCHEMAS['Summary']
+    header_cells = header_template_cells(header_wb[schema['header_sheet']],schema['columns'])
+
+    def sheet_spec(name, df):
+        header, header_styles = report_writer.template_header(df.drop(columns=[c.SOURCE_FLAGS_COLUMN]),header_cells)
+        return {'name': name, 'df': df, 'header': header, 'header_styles': header_styles, 'date_col': c.due_date_idx_summary}
+
+    store = report_writer.open_chunk_store(spill)
+    layouts = {}
+    accumulate = totals is None
+    try:
+        for raw_df, working_df, frames in chunks:
+            if raw_df is not None:
+                report_writer.add_chunk(store,'Sheet1',raw_df) # Raw export kept as hidden Sheet1 
+                layouts.setdefault('Sheet1',{'name': 'Sheet1', 'header': list(raw_df.columns), 'hidden': True, 'date_col': c.due_date_idx_summary})
+
+            if c.SUMMARY_FORMULA_MODE in ('values','both') and accumulate:
+                totals = summary_totals(frames,totals)
+
+            specs = [sheet_spec('TPR Working',working_df)] + [sheet_spec(sheet_name,df) for sheet_name, df in frames.items()]
+            for spec in specs:
+                report_writer.add_chunk(store,spec['name'],spec['df'])
+                layouts.setdefault(spec['name'],{key: value for key, value in spec.items() if key != 'df'})
+
+        # Summary rows are laid out from the stored OHS rows once the totals cover every chunk 
+        ohs_spec = report_writer.stored_spec(store,**layouts['OHS'])
+
+        def summary_chunks():
+            first_row = 2
+            for ohs_df in ohs_spec['chunks']():
+                yield summary_spec(ohs_df,summary_column_values(ohs_df,totals,first_row))['df']
+                first_row += len(ohs_df)
+
+        first_ohs_df = next(ohs_spec['chunks']()) # header of the Summary sheet 
+        summary = summary_spec(first_ohs_df,summary_column_values(first_ohs_df,totals))
+        del summary['df']
+        summary['chunks'] = summary_chunks
+        summary['widths'] = {}
+        for summary_df in summary_chunks():
+            summary['widths'] = report_writer.frame_widths(summary_df,summary['widths'])
+
+        specs = [report_writer.stored_spec(store,**layouts['Sheet1'])] if 'Sheet1' in layouts else []
+        specs += [report_writer.stored_spec(store,**layouts['TPR Working']), summary]
+        specs += [report_writer.stored_spec(store,**layout) for sheet_name, layout in layouts.items() if sheet_name not in ('Sheet1','TPR Working')]
+        report_writer.write_only_workbook(c.dest_summary_file,specs)
+    finally:
+        report_writer.close_chunk_store(store)
 
 if __name__ == "__main__":
     main_summary()
@@ -0,0 +1,103 @@
+import constants as c
+import os
+import sys
+import time
+
+from file_handler import load_excel_workbook
+
+from main_all import apply_constants
+from main_all import main_all
+from main_batch import find_snapshots
+from main_batch import snapshot_settings
+
+# Long-running watcher: pandas, openpyxl and win32com stay imported and the header workbooks (with their Area table)
+# stay loaded between snapshots, so a new export only pays for its own processing.
+
+_headers = {} # header file path: (size and modification time, loaded workbook)
+_file_changes = {} # watched file path: (size and modification time, time it was first seen with them)
+
+def file_state(path):
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def is_settled(path, now):
+    """
+    Returns True once a file has kept the same size and modification time for WATCH_SETTLE_SECONDS and can be opened
+    (Windows keeps a file being copied or exported locked).
+    """
+    state = file_state(path)
+    if state is None:
+        return False
+    if _file_changes.get(path, (None,))[0] != state:
+        _file_changes[path] = (state, now)
+        return False
+    if now - _file_changes[path][1] < c.WATCH_SETTLE_SECONDS:
+        return False
+    try:
+        with open(path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+def cached_header(path):
+    """
+    Returns the loaded header workbook, reloaded only when the file changed since it was loaded.
+    """
+    state = file_state(path)
+    if path not in _headers or _headers[path][0] != state:
+        _headers[path] = (state, load_excel_workbook(path))
+    return _headers[path][1]
+
+def snapshot_id(snapshot):
+    return (snapshot['source_file'], snapshot['qoh_file'], file_state(snapshot['source_file']), file_state(snapshot['qoh_file']))
+
+def build_snapshot(snapshot, constants):
+    """
+    Builds both workbooks of a snapshot in this process with the cached header workbook, into WATCH_DEST_DIR.
+    """
+    start = time.perf_counter()
+    settings = snapshot_settings(snapshot, c.WATCH_DEST_DIR)
+    try:
+        apply_constants({**constants, **settings})
+        os.makedirs(os.path.dirname(settings['dest_file']), exist_ok=True)
+        main_all(header_wb=cached_header(snapshot['header_file']))
+        print(f"Snapshot '{snapshot['name']}' built in {time.perf_counter() - start:.1f}s.")
+    except Exception as e:
+        print(f"[ERROR] Snapshot '{snapshot['name']}' failed: {e}")
+    finally:
+        apply_constants(constants)
+
+def main_watch(folder=None):
+    """
+    Polls folder (WATCH_SOURCE_DIR) every WATCH_POLL_SECONDS and builds the reports of every new snapshot (csv export
+    paired with its Quantity on hand file, see main_batch.find_snapshots) once both files are fully written.
+    A snapshot whose files are rewritten is built again. Stop with Ctrl+C.
+    """
+    folder = folder or c.WATCH_SOURCE_DIR
+    constants = {name: value for name, value in vars(c).items() if not name.startswith('__')}
+    done = set()
+    if not c.WATCH_PROCESS_EXISTING:
+        done.update(snapshot_id(snapshot) for snapshot in find_snapshots(folder))
+    print(f"Watching '{folder}' for new exports ({len(done)} existing snapshots skipped), Ctrl+C to stop.")
+
+    try:
+        while True:
+            now = time.monotonic()
+            for snapshot in find_snapshots(folder):
+                if snapshot['qoh_file'] is None or snapshot_id(snapshot) in done:
+                    continue
+                if not (is_settled(snapshot['source_file'], now) and is_settled(snapshot['qoh_file'], now)):
+                    continue
+                done.add(snapshot_id(snapshot))
+                build_snapshot(snapshot, constants)
+            time.sleep(c.WATCH_POLL_SECONDS)
+    except KeyboardInterrupt:
+        print("Watcher stopped.")
+
+if __name__ == "__main__":
+    main_watch(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,284 @@
+import constants as c
+import os
+import pandas as pd
+import shutil
+import tempfile
+from file_handler import widen_floats
+from copy import copy
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.comments import Comment
+from openpyxl.styles import Font
+from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.defined_name import DefinedName
+
+# Streaming output backend (OUTPUT_BACKEND = 'write_only').
+# Every output sheet is described up front by a sheet spec dict:
+#   'name'          sheet title
+#   'df'            DataFrame written from A1 (header + rows), internal columns are left out
+#   'chunks'        instead of 'df': callable returning the frames of the sheet one chunk at a time ('header' and
+#                   'widths', the longest value per column from frame_widths, are then required)
+#   'header'        optional header values replacing the df column names (None for empty header cells)
+#   'header_styles' optional list of style dicts (or None) per header cell, see header_style()
+#   'date_col'      optional 1-based column whose data cells get the DD/MM/YYYY format
+#   'cells'         optional {(row, col): (value, style dict or None)} written beside/below the frame (pivot blocks, notes)
+#   'hidden'        True to hide the sheet
+# The sheets are streamed row by row with openpyxl write_only, so only the current rows are held as cells.
+
+GREEN_FILL = PatternFill(start_color="A9D08E", end_color="A9D08E", fill_type="solid")
+BOLD_FONT = Font(bold=True)
+DATE_STYLE = {'number_format': 'DD/MM/YYYY'}
+BOLD_STYLE = {'font': BOLD_FONT}
+
+def header_style(template_cell=None):
+    """
+    Returns the green/bold header style, with border, alignment, number format and protection
+    copied from the reference header cell when it has a style (same as copy_header_styles).
+    """
+    style = {'fill': GREEN_FILL, 'font': BOLD_FONT}
+    if template_cell is not None and template_cell.has_style:
+        style['border'] = copy(template_cell.border)
+        style['alignment'] = copy(template_cell.alignment)
+        style['number_format'] = template_cell.number_format
+        style['protection'] = copy(template_cell.protection)
+    return style
+
+def spec_frame(spec):
+    return spec['df'].drop(columns=[c.SOURCE_FLAGS_COLUMN], errors='ignore')
+
+def spec_chunks(spec, chunk_rows=c.WRITE_CHUNK_ROWS):
+    if 'chunks' in spec:
+        for chunk in spec['chunks']():
+            yield chunk.drop(columns=[c.SOURCE_FLAGS_COLUMN], errors='ignore')
+        return
+    df = spec_frame(spec)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def spec_header(spec):
+    return spec.get('header') or list(spec_frame(spec).columns)
+
+def frame_widths(df, widths=None):
+    """
+    Returns the longest value per column (1-based) of a frame, merged with widths of earlier chunks of the same sheet.
+    """
+    widths = dict(widths or {})
+    df = widen_floats(df.drop(columns=[c.SOURCE_FLAGS_COLUMN], errors='ignore'))
+    for col_idx in range(1, len(df.columns) + 1):
+        values = df.iloc[:, col_idx - 1]
+        lengths = values.astype(object).astype(str).where(values.notna(), 'None').str.len() # datetimes measured as written, time included
+        if len(lengths):
+            widths[col_idx] = max(widths.get(col_idx, 0), int(lengths.max()))
+    return widths
+
+def column_widths(spec):
+    """
+    Computes the column widths up front (longest value + 2, like adjust_column_width) from the frame (or the widths
+    collected while its chunks were spilled), the header and the extra cells.
+    """
+    widths = dict(spec['widths']) if 'widths' in spec else frame_widths(spec_frame(spec))
+    header = spec_header(spec)
+    for col_idx in range(1, max([len(header)] + list(widths)) + 1):
+        header_width = len(str(header[col_idx - 1])) if col_idx <= len(header) else 4
+        widths[col_idx] = max(widths.get(col_idx, 0), header_width)
+
+    for (row, col), (value, _) in spec.get('cells', {}).items():
+        widths[col] = max(widths.get(col, 4), len(str(value)))
+    return {col: width + 2 for col, width in widths.items()}
+
+def styled_cell(ws, value, style):
+    if not style:
+        return value
+    cell = WriteOnlyCell(ws, value=value)
+    for attr, attr_value in style.items():
+        setattr(cell, attr, attr_value)
+    return cell
+
+def stream_rows(ws, spec, chunk_rows=c.WRITE_CHUNK_ROWS):
+    """
+    Yields the rows of a sheet spec: header, frame rows (converted chunk by chunk) and the extra cells merged in by position.
+    """
+    header = spec_header(spec)
+    header_styles = spec.get('header_styles') or []
+    date_col = spec.get('date_col')
+
+    extra_rows = {}
+    for (row, col), (value, style) in spec.get('cells', {}).items():
+        extra_rows.setdefault(row, {})[col] = (value, style)
+
+    def date_row(values):
+        # Every data row gets its date column cell with the date format, blank ones too (as format_due_date does
+        # on the standard sheets, even beyond the last column of a narrower frame such as Inventory by WH)
+        if not date_col:
+            return values
+        values = values + [None] * (date_col - len(values))
+        values[date_col - 1] = styled_cell(ws, values[date_col - 1], DATE_STYLE)
+        return values
+
+    def merge(row_idx, values):
+        extras = extra_rows.pop(row_idx, {})
+        if extras:
+            values = values + [None] * (max(extras) - len(values))
+            for col, (value, style) in extras.items():
+                values[col - 1] = styled_cell(ws, value, style)
+        return values
+
+    header = list(header) + [None] * (len(header_styles) - len(header))
+    yield merge(1, [styled_cell(ws, value, header_styles[idx] if idx < len(header_styles) else None) for idx, value in enumerate(header)])
+
+    row_idx = 2
+    for chunk in spec_chunks(spec, chunk_rows):
+        chunk = widen_floats(chunk)
+        for values in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+            yield merge(row_idx, date_row(list(values)))
+            row_idx += 1
+
+    for extra_row in sorted(extra_rows):
+        while row_idx < extra_row:
+            yield date_row([])
+            row_idx += 1
+        yield merge(extra_row, date_row([]))
+        row_idx += 1
+
+def template_header(df, template_cells):
+    """
+    Returns the header values and styles of a frame whose header is copied from reference header cells
+    (as copy_header_styles does). Columns beyond the reference cells keep their frame names, unstyled.
+    """
+    header = [cell.value for cell in template_cells] + list(df.columns[len(template_cells):])
+    return header, [header_style(cell) for cell in template_cells]
+
+def extend_frame(df, columns):
+    """
+    Returns the frame with the columns keyed by 1-based column index appended after its own columns,
+    missing indexes in between stay empty (see append_columns). Indexes of the frame's own columns are an error,
+    they would be dropped.
+    """
+    df = df.drop(columns=[c.SOURCE_FLAGS_COLUMN], errors='ignore')
+    overlap = [int(col) for col in columns.columns if int(col) <= len(df.columns)]
+    if overlap:
+        raise ValueError(f"Columns {overlap} are within the {len(df.columns)} columns of the frame")
+    last_col = max([len(df.columns)] + [int(col) for col in columns.columns])
+
+    extra = pd.DataFrame(index=range(len(df)))
+    for col_idx in range(len(df.columns) + 1, last_col + 1):
+        extra[f'_col{col_idx}'] = columns[col_idx].to_numpy() if col_idx in columns.columns else None
+    return pd.concat([df.reset_index(drop=True), extra], axis=1)
+
+def append_columns(spec, columns, header=None, header_styles=None):
+    """
+    Appends columns to a spec's frame.
+
+    Parameters:
+    - columns: DataFrame aligned with the spec rows, keyed by 1-based column index (e.g. formula_map columns),
+      missing indexes in between stay empty
+    - header / header_styles: header values and styles of the appended columns, in column order
+    """
+    df = spec_frame(spec)
+    names = spec_header(spec)
+    styles = list(spec.get('header_styles') or [])
+    styles += [None] * (len(names) - len(styles))
+    last_col = max([len(df.columns)] + [int(col) for col in columns.columns])
+
+    spec['df'] = extend_frame(df, columns)
+    spec['header'] = names + list(header or []) + [None] * (last_col - len(names) - len(header or []))
+    spec['header_styles'] = styles + list(header_styles or [])
+    return spec
+
+def add_header_comments(spec, formula_map):
+    """
+    Attaches the formula each computed column stands for to its header cell as a comment (write_formula_values).
+    """
+    styles = list(spec.get('header_styles') or [])
+    for col_index_str, formula_template in formula_map.items():
+        idx = int(col_index_str) - 1
+        styles += [None] * (idx + 1 - len(styles))
+        styles[idx] = dict(styles[idx] or {}, comment=Comment(formula_template, 'TPR Automation'))
+    spec['header_styles'] = styles
+    return spec
+
+def named_frame(spec):
+    """
+    Returns the spec frame with the header values as column names (pivot source of the local backend).
+    """
+    df = spec_frame(spec)
+    return df.set_axis(spec_header(spec)[:len(df.columns)], axis=1)
+
+def formula_columns(formula_map, row_count, first_row=2):
+    """
+    Returns the formulas of a formula map for row_count data rows from first_row, keyed by column index.
+    """
+    rows = range(first_row, first_row + row_count)
+    return pd.DataFrame({int(col_index_str): [formula_template.format(row=row) for row in rows]
+                         for col_index_str, formula_template in formula_map.items()}, index=range(row_count))
+
+def open_chunk_store(spill=False):
+    """
+    Returns a store collecting the frames of every sheet chunk by chunk. With spill=True the chunks are pickled
+    to a temporary folder (chunked streaming mode) so only the chunk being processed stays in memory.
+    """
+    return {'dir': tempfile.mkdtemp(prefix='tpr_chunks_') if spill else None, 'sheets': {}, 'count': 0}
+
+def add_chunk(store, sheet_name, df):
+    """
+    Adds one chunk of a sheet to the store and updates the sheet's row count and value widths.
+    """
+    sheet = store['sheets'].setdefault(sheet_name, {'chunks': [], 'rows': 0, 'widths': {}})
+    sheet['widths'] = frame_widths(df, sheet['widths'])
+    sheet['rows'] += len(df)
+    if store['dir'] is None:
+        sheet['chunks'].append(df)
+        return
+    store['count'] += 1
+    path = os.path.join(store['dir'], f"{store['count']}.pkl")
+    df.to_pickle(path)
+    sheet['chunks'].append(path)
+
+def stored_rows(store, sheet_name):
+    return store['sheets'].get(sheet_name, {}).get('rows', 0)
+
+def stored_spec(store, name, header, header_styles=None, **options):
+    """
+    Returns the sheet spec of a stored sheet, its chunks are read back one at a time while the sheet is streamed.
+    """
+    sheet = store['sheets'].get(name, {'chunks': [], 'rows': 0, 'widths': {}})
+
+    def chunks():
+        for chunk in sheet['chunks']:
+            yield pd.read_pickle(chunk) if isinstance(chunk, str) else chunk
+
+    return {'name': name, 'chunks': chunks, 'widths': sheet['widths'], 'header': header, 'header_styles': header_styles, **options}
+
+def close_chunk_store(store):
+    if store['dir'] is not None:
+        shutil.rmtree(store['dir'], ignore_errors=True)
+
+def write_only_workbook(file_path, sheets, defined_names=None):
+    """
+    Streams the sheet specs into a new workbook with openpyxl write_only and saves it.
+    Column widths, frozen header row, hidden state and conditional formats are applied before any row is written.
+    defined_names ({name: constant formula}) are added as workbook names.
+    """
+    wb = Workbook(write_only=True)
+    for name, value in (defined_names or {}).items():
+        wb.defined_names[name] = DefinedName(name, attr_text=value)
+    for spec in sheets:
+        ws = wb.create_sheet(title=spec['name'])
+        ws.freeze_panes = 'A2'
+        if spec.get('hidden'):
+            ws.sheet_state = 'hidden'
+        for col_idx, width in column_widths(spec).items():
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+        for cell_range, rule in spec.get('conditional_formats', []):
+            ws.conditional_formatting.add(cell_range, rule)
+
+        rows = 0
+        for row in stream_rows(ws, spec):
+            ws.append(row)
+            rows += 1
+        print(f"'{spec['name']}' sheet streamed ({rows} rows).")
+
+    wb.save(file_path)
+    print(f"Workbook '{file_path}' written.")
@@ -0,0 +1,166 @@
+import constants as c
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError: # Windows, the peak working set is read with psutil when it is installed
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Lightweight tracing of the pipeline stages (RUN_REPORT). Every stage() block records its wall time, CPU time,
+# peak RSS and, with TRACE_MEMORY, the tracemalloc delta and peak of the stage; rows in/out can be added to the record.
+# traced_run() writes the records of a run to RUN_REPORT_FILE as JSON and, with PROFILE_RUN, dumps a cProfile of the run.
+
+_records = []
+_open_peaks = [] # tracemalloc peaks of the enclosing stages, kept when a nested stage resets the peak
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the process so far in MB, None when it cannot be read on this platform.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 2**20 if sys.platform == 'darwin' else peak / 2**10, 1) # bytes on macOS, KB on Linux
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 2**20, 1)
+    return None
+
+@contextmanager
+def stage(name, **info):
+    """
+    Records one pipeline stage. Extra fields (rows_in, rows_out per sheet, ...) can be passed up front or set on the
+    yielded record inside the block.
+
+    Example:
+        with stage('partition', rows_in=len(df)) as record:
+            frames = partition_frame(df, config)
+            record['rows_out'] = {name: len(frame) for name, frame in frames.items()}
+
+    Nothing is recorded without RUN_REPORT (the yielded record is discarded).
+    """
+    record = {'stage': name, **info}
+    if not c.RUN_REPORT:
+        yield record
+        return
+    tracing_memory = tracemalloc.is_tracing()
+    if tracing_memory:
+        memory_start, peak_so_far = tracemalloc.get_traced_memory()
+        if _open_peaks:
+            _open_peaks[-1] = max(_open_peaks[-1], peak_so_far)
+        _open_peaks.append(memory_start)
+        tracemalloc.reset_peak()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+        record['status'] = 'ok'
+    except Exception as e:
+        record['status'] = f"error: {e}"
+        raise
+    finally:
+        record['wall_s'] = round(time.perf_counter() - wall_start, 3)
+        record['cpu_s'] = round(time.process_time() - cpu_start, 3)
+        record['peak_rss_mb'] = peak_rss_mb()
+        if tracing_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, _open_peaks.pop())
+            if _open_peaks:
+                _open_peaks[-1] = max(_open_peaks[-1], peak)
+            record['alloc_delta_mb'] = round((current - memory_start) / 2**20, 2)
+            record['alloc_peak_mb'] = round((peak - memory_start) / 2**20, 2)
+        _records.append(record)
+
+def frame_rows(frames):
+    """
+    Returns the row count of every frame of a {sheet name: DataFrame} dict (rows out per sheet).
+    """
+    return {name: len(df) for name, df in frames.items()}
+
+def take_records():
+    """
+    Returns the stage records collected so far and clears them (stages traced in a worker process are sent back to the parent).
+    """
+    records = list(_records)
+    _records.clear()
+    return records
+
+def add_records(records, **info):
+    _records.extend(dict(record, **info) for record in records)
+
+@contextmanager
+def traced_run(run_name):
+    """
+    Traces a whole run (main, main_summary, main_all): the stage records are written to RUN_REPORT_FILE when the run
+    ends, even when it fails, and the run is profiled with cProfile when PROFILE_RUN is set.
+    """
+    if not c.RUN_REPORT:
+        yield
+        return
+
+    _records.clear()
+    started = datetime.now()
+    if c.TRACE_MEMORY:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if c.PROFILE_RUN else None
+    if profiler is not None:
+        profiler.enable()
+
+    status = 'ok'
+    try:
+        with stage('total'):
+            yield
+    except Exception as e:
+        status = f"error: {e}"
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(c.PROFILE_FILE.format(run=run_name))
+        if c.TRACE_MEMORY:
+            tracemalloc.stop()
+        write_run_report(run_name, started, status)
+
+def add_worker_totals(stages):
+    """
+    Adds the CPU time and peak RSS of the worker processes ('worker build' records, see main_all.run_build) to the
+    'total' record, which only measures this process. The parent's own figures are kept as parent_cpu_s and
+    parent_peak_rss_mb; the summed peak RSS is an upper bound, the workers run side by side.
+    """
+    workers = [record for record in stages if record['stage'] == 'worker build']
+    total = next((record for record in stages if record['stage'] == 'total'), None)
+    if total is None or not workers:
+        return
+    total['parent_cpu_s'], total['parent_peak_rss_mb'] = total['cpu_s'], total['peak_rss_mb']
+    total['cpu_s'] = round(total['cpu_s'] + sum(record['cpu_s'] for record in workers), 3)
+    total['peak_rss_mb'] = round((total['peak_rss_mb'] or 0) + sum(record['peak_rss_mb'] or 0 for record in workers), 1)
+    total['workers'] = len(workers)
+
+def write_run_report(run_name, started, status):
+    stages = take_records()
+    add_worker_totals(stages)
+    report = {
+        'run': run_name,
+        'started': started.isoformat(timespec='seconds'),
+        'status': status,
+        'source_file': c.source_file,
+        'source_bytes': os.path.getsize(c.source_file) if os.path.exists(c.source_file) else None,
+        'config': {name: getattr(c, name) for name in ('PIVOT_BACKEND', 'OUTPUT_BACKEND', 'TPR_FORMULA_MODE', 'SUMMARY_FORMULA_MODE',
+                                                        'CSV_DTYPE_MODE', 'CSV_CHUNK_ROWS', 'STAGE_CACHE', 'REPORT_WORKERS')},
+        'stages': stages,
+    }
+    path = c.RUN_REPORT_FILE.format(run=run_name)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Run report written to '{path}'.")
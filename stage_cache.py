@@ -0,0 +1,116 @@
+import constants as c
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pickle
+
+# Stage cache (STAGE_CACHE): the outputs of the pipeline stages (csv parse, Working prep + partitions, inventory
+# import + Area mapping, aggregations) are pickled to STAGE_CACHE_DIR under a key hashed from everything the stage
+# reads: input file contents, the constants it depends on, the code it runs (the whole pipeline modules, see
+# pipeline_modules) and the keys of the stages it is fed by. A rerun after only the QOH file changed reuses the csv stages, and so on.
+# Least recently used entries are evicted once the folder grows past STAGE_CACHE_MAX_MB.
+
+# Modules holding the code run by the cached stages, hashed whole
+PIPELINE_MODULES = ['aggregation', 'data_manipulation', 'file_handler', 'filtering', 'helper', 'local_backend', 'worksheet_manager']
+
+_file_digests = {}
+
+def file_digest(path):
+    """
+    Returns the sha1 of a file's content, memoised per (path, size, modification time) for the current run.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[memo_key] = digest.hexdigest()
+    return _file_digests[memo_key]
+
+def _part_text(part):
+    if inspect.isfunction(part) or inspect.ismodule(part):
+        return inspect.getsource(part) # code changes invalidate the stage
+    return repr(part)
+
+def pipeline_modules():
+    """
+    Returns the PIPELINE_MODULES for stage_key. Their whole source is hashed, so editing any helper a stage calls
+    (a filter lambda, the numeric conversion, aggregation internals, ...) invalidates the cached stages, not only
+    editing the stage's entry point.
+    """
+    return [importlib.import_module(name) for name in PIPELINE_MODULES]
+
+def stage_key(*parts):
+    """
+    Hashes the inputs of a stage (file digests, upstream stage keys, constants, functions or modules) into a cache key.
+    Returns None when an upstream key is None (that stage was not cached), so nothing downstream is cached either.
+    """
+    if any(part is None for part in parts):
+        return None
+    text = json.dumps(parts, sort_keys=True, default=_part_text)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def cached_stage(stage, key, compute):
+    """
+    Returns the cached output of a stage when its key was seen before, otherwise runs compute() and caches its output.
+    A stage that raises or returns None (failed) is not cached, the next run computes it again.
+
+    Parameters:
+    - stage: stage name, used in the cache file name
+    - key: stage_key of the stage inputs, None runs the stage without caching
+    - compute: callable producing the stage output (frames, tuples or dicts of frames)
+    """
+    if not c.STAGE_CACHE or key is None:
+        return compute()
+
+    path = os.path.join(c.STAGE_CACHE_DIR, f"{stage}-{key}.pkl")
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        os.utime(path) # recently used, kept by the eviction
+        print(f"Stage '{stage}' loaded from the cache.")
+        return value
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Cached stage '{stage}' could not be read, recomputing: {e}")
+
+    value = compute()
+    if value is None:
+        return value
+    os.makedirs(c.STAGE_CACHE_DIR, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path) # both report processes may write the cache at once
+    evict_stages()
+    return value
+
+def evict_stages(max_mb=None):
+    """
+    Removes the least recently used cache entries until the cache folder holds at most max_mb (STAGE_CACHE_MAX_MB).
+    """
+    max_bytes = (c.STAGE_CACHE_MAX_MB if max_mb is None else max_mb) * 2**20
+    entries = []
+    for name in os.listdir(c.STAGE_CACHE_DIR):
+        if name.endswith('.pkl'):
+            try:
+                stat = os.stat(os.path.join(c.STAGE_CACHE_DIR, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(c.STAGE_CACHE_DIR, name))
+            print(f"Stage cache entry '{name}' evicted.")
+        except FileNotFoundError:
+            pass
+        total -= size
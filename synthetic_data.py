@@ -0,0 +1,143 @@
+import argparse
+import numpy as np
+import os
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+# Synthetic inputs for benchmarking (benchmark.py) without a real ERP export: the Time Phase Material Requirement csv
+# (columns A to BK, txtDueDate in AX), the Quantity on hand workbook ('Results' sheet) and the header workbook
+# ('Header', 'SummaryHeader', 'Area'), laid out the way CSV_SCHEMAS, COLUMNS_TO_DELETE_*, due_date_idx and the pivot
+# ranges in constants.py expect them.
+
+CSV_LAST_COLUMN = 63 # BK
+
+# Header names of the report columns, the other columns get placeholder names
+HEADER_NAMES = {
+    'B': 'PartNum', 'K': 'Description', 'L': 'Revision', 'M': 'Class', 'N': 'Type', 'Q': 'Plant', 'R': 'Warehouse', 'S': 'Bin',
+    'AA': 'Lot', 'AB': 'UOM', 'AU': 'Buyer', 'AV': 'Vendor', 'AW': 'Source', 'AX': 'Due Date', 'AY': 'Receipts',
+    'AZ': 'Requirements', 'BA': 'Balance', 'BB': 'Lead Time', 'BC': 'Planner', 'BK': 'Unit',
+}
+
+# Source mix of a daily export (share of rows), quantities are filled as the ERP does for each kind of row
+SOURCE_MIX = {
+    'On-Hand Quantity': 0.12,
+    'Job: MRP Planned Order': 0.10,
+    'Job: Job Start': 0.14,
+    'SO: Sales Order': 0.14,
+    'PO: Purchase Order': 0.12,
+    'Forecast': 0.12,
+    'Suggestion: Expedite': 0.06,
+    'Suggestion: Postpone': 0.06,
+    'Suggestion: New PO': 0.14,
+}
+RECEIPT_SOURCES = ['Job: MRP Planned Order', 'Job: Job Start', 'PO: Purchase Order', 'Suggestion: Expedite', 'Suggestion: Postpone', 'Suggestion: New PO']
+REQUIREMENT_SOURCES = ['Job: Job Start', 'SO: Sales Order', 'Forecast']
+
+CLASSES = ['01', '41', '02', '05', '11']
+WAREHOUSES = [f"WH{idx:02d}" for idx in range(1, 13)]
+AREAS = ['North', 'South', 'East', 'Delta', None] # None: blank Area (shown as 0)
+
+def quantity_text(values):
+    """
+    Formats quantities the way the export does, with thousands separators.
+    """
+    return pd.Series(values).map('{:,}'.format)
+
+def generate_csv(path, rows, rng):
+    parts = max(rows // 20, 10)
+    part_ids = rng.integers(1, parts + 1, rows)
+    sources = rng.choice(list(SOURCE_MIX), size=rows, p=np.array(list(SOURCE_MIX.values())) / sum(SOURCE_MIX.values()))
+    due_dates = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 730, rows), unit='D')
+
+    columns = {}
+    for col_idx in range(1, CSV_LAST_COLUMN + 1):
+        letter = get_column_letter(col_idx)
+        columns[letter] = np.full(rows, f"{letter}{col_idx % 7}", dtype=object) # filler columns of the export
+
+    columns['B'] = ('P' + pd.Series(part_ids).astype(str).str.zfill(6)).to_numpy()
+    columns['K'] = ('Part ' + pd.Series(part_ids).astype(str)).to_numpy()
+    columns['L'] = rng.choice(['A', 'B', 'C'], rows)
+    columns['M'] = np.array(CLASSES)[part_ids % len(CLASSES)] # a part keeps its class
+    columns['N'] = rng.choice(['M', 'P'], rows, p=[0.6, 0.4])
+    columns['Q'] = 'MfgSys'
+    columns['R'] = rng.choice(WAREHOUSES, rows)
+    columns['S'] = rng.choice(['A-01', 'B-02', 'C-03'], rows)
+    columns['AU'] = rng.choice(['BUY1', 'BUY2', 'BUY3'], rows)
+    columns['AW'] = sources
+    dates = pd.Series(due_dates.strftime('%d/%m/%Y'))
+    columns['AX'] = dates.where(rng.random(rows) > 0.03, '').to_numpy() # a few rows without due date
+
+    receipts = quantity_text(rng.integers(1, 5000, rows))
+    columns['AY'] = receipts.where(pd.Series(sources).isin(RECEIPT_SOURCES).to_numpy(), '').to_numpy()
+    requirements = quantity_text(rng.integers(1, 5000, rows))
+    columns['AZ'] = requirements.where(pd.Series(sources).isin(REQUIREMENT_SOURCES).to_numpy(), '').to_numpy()
+    columns['BA'] = quantity_text(rng.integers(-500, 20000, rows)).to_numpy()
+    columns['BB'] = rng.integers(1, 60, rows).astype(str)
+    columns['BC'] = rng.choice(['PLN1', 'PLN2'], rows)
+    columns['BK'] = 'EA'
+
+    names = ['txtDueDate' if letter == 'AX' else f"col{letter}" for letter in columns]
+    pd.DataFrame(columns).set_axis(names, axis=1).to_csv(path, index=False)
+    return parts
+
+def generate_qoh(path, rows, parts, rng):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Results')
+    ws.append(['Company', 'Site', 'Part Num', 'Description', 'Warehouse', 'Bin', 'On Hand', 'UOM'])
+    part_ids = rng.integers(1, parts + 1, rows)
+    warehouses = rng.choice(WAREHOUSES + ['WH99'], rows) # WH99 is missing from the Area table
+    on_hand = rng.integers(0, 500, rows)
+    for part_id, warehouse, quantity in zip(part_ids, warehouses, on_hand):
+        ws.append(['EPIC', 'MfgSys', f"P{part_id:06d}", f"Part {part_id}", warehouse, 'A-01', int(quantity), 'EA'])
+    wb.save(path)
+
+def generate_header(path):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet_name in ('Header', 'SummaryHeader'):
+        ws = wb.create_sheet(sheet_name)
+        for col_idx in range(1, CSV_LAST_COLUMN + 1):
+            letter = get_column_letter(col_idx)
+            cell = ws.cell(row=1, column=col_idx, value=HEADER_NAMES.get(letter, f"H{letter}"))
+            cell.font = Font(bold=True)
+    ws = wb.create_sheet('Area')
+    ws.append(['Warehouse', 'Area'])
+    for idx, warehouse in enumerate(WAREHOUSES):
+        ws.append([warehouse, AREAS[idx % len(AREAS)]])
+    wb.save(path)
+
+def generate(rows, folder, seed=0, qoh_rows=None):
+    """
+    Writes a synthetic csv export of `rows` rows, its Quantity on hand workbook and the header workbook to folder.
+
+    Parameters:
+    - rows: csv rows
+    - folder: output folder
+    - seed: random seed, the same seed gives the same files
+    - qoh_rows: rows of the Quantity on hand sheet (default rows / 4)
+
+    Returns:
+    - dict: 'source_file', 'qoh_file' and 'header_file' paths (constants.py names)
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = {
+        'source_file': os.path.join(folder, 'Time Phase Material Requirement.csv'),
+        'qoh_file': os.path.join(folder, 'Quantity on hand.xlsx'),
+        'header_file': os.path.join(folder, 'TPR HEADER.xlsx'),
+    }
+    parts = generate_csv(paths['source_file'], rows, rng)
+    generate_qoh(paths['qoh_file'], qoh_rows or max(rows // 4, 1), parts, rng)
+    generate_header(paths['header_file'])
+    print(f"Synthetic inputs with {rows} csv rows written to '{folder}'.")
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic TPR inputs (csv export, Quantity on hand, header workbook).')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--out', default='source/synthetic')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.rows, args.out, args.seed)
@@ -0,0 +1,194 @@
+import math
+import re
+from datetime import datetime
+
+import pandas as pd
+
+import aggregation
+import constants as c
+import local_backend
+from data_manipulation import formula_column_blocks
+from data_manipulation import generate_formula_TPR_SUMMARY
+from data_manipulation import highlight_overdue
+from data_manipulation import map_inventory_area
+from data_manipulation import write_summary_info
+from data_manipulation import year_month_frame
+from fake_com import FakeWorkbook
+from helper import overdue_formula
+from openpyxl import Workbook
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils import get_column_letter
+
+SETUP_CALLS = 3 # Sheets, Cells and End of the last row lookup
+CALLS_PER_WRITE = 4 # two Cells, one Range and the Formula assignment
+
+def inventory_workbook(rows, sheet_name='TPR Inventory'):
+    wb = FakeWorkbook()
+    wb.add_sheet(sheet_name, [['Part Num']] + [[f"P{row:06d}"] for row in range(1, rows + 1)])
+    return wb
+
+def test_formula_column_blocks_groups_adjacent_columns():
+    blocks = formula_column_blocks({'4': '=D{row}', '3': '=C{row}', '7': '=G{row}'})
+    assert blocks == [(3, ['=C{row}', '=D{row}']), (7, ['=G{row}'])]
+
+def test_formulas_written_to_every_data_row():
+    wb = inventory_workbook(25)
+    generate_formula_TPR_SUMMARY(wb, 'TPR Inventory', {'3': '=A{row}*2', '4': '=C{row}+1', '7': '=A{row}'}, batch_rows=10)
+    cells = wb.sheets['TPR Inventory'].cells
+    assert cells[(2, 3)] == '=A2*2'
+    assert cells[(26, 4)] == '=C26+1'
+    assert cells[(26, 7)] == '=A26'
+    assert (1, 3) not in cells and (27, 3) not in cells
+    assert (2, 5) not in cells # columns between the blocks are left alone
+
+def test_one_com_write_per_block_and_batch():
+    rows, batch_rows = 25, 10
+    wb = inventory_workbook(rows)
+    generate_formula_TPR_SUMMARY(wb, 'TPR Inventory', c.formula_map_tpr, batch_rows=batch_rows)
+    writes = len(formula_column_blocks(c.formula_map_tpr)) * math.ceil(rows / batch_rows)
+    assert wb.com_calls == SETUP_CALLS + CALLS_PER_WRITE * writes
+
+    first_col = min(int(col_index) for col_index in c.formula_map_tpr)
+    assert wb.sheets['TPR Inventory'].cells[(rows + 1, first_col)] == c.formula_map_tpr[str(first_col)].format(row=rows + 1)
+
+def test_overdue_rule_points_at_pivot_row_labels():
+    wb = FakeWorkbook()
+    wb.add_sheet('Working') # active sheet, A1 active, as when the win32com phase opens the workbook
+    ws = wb.add_sheet('Schedule')
+    pivot = {'first_row': 3, 'first_col': 24, 'last_row': 40, 'last_col': 30}
+    highlight_overdue(ws, pivot)
+
+    [(address, rule_type, condition)] = ws.format_conditions
+    assert (address, rule_type) == ('X3:X40', 2)
+    assert condition.Formula1 == f"={overdue_formula('X3')}"
+    assert set(re.findall(r"\$?[A-Z]+\d+", condition.Formula1)) == {'$X3'}
+    assert condition.Interior.Color == 65535
+
+def test_summary_info_written_below_the_pivot_extent():
+    wb = FakeWorkbook()
+    ws = wb.add_sheet('MRP')
+    wb.names.update({c.MRP_SUMMARY_NAMES['parts']: 131.0, c.MRP_SUMMARY_NAMES['up_till']: 'Data shown up till Dec 2025'})
+    write_summary_info(wb, ws, {'first_row': 1, 'first_col': 15, 'last_row': 9, 'last_col': 20}) # Excel's pivot, (blank) row included
+
+    assert ws.cells[(11, 15)] == 'Total No. of Parts'
+    assert ws.cells[(11, 16)] == 131
+    assert ws.cells[(13, 15)] == 'Data shown up till Dec 2025'
+    assert ws.formats[(11, 16)] == {'Font.Bold': True, 'Interior.Color': 15773696}
+    assert ws.formats[(13, 15)] == {'Font.Bold': True}
+    assert wb.names == {} # only carried the figures to the win32com phase
+
+def test_summary_info_names_from_the_mrp_frame():
+    mrp_df = pd.DataFrame({'PartNum': ['P1', 'P2', 'P1', None], 'Due Date': pd.to_datetime(['2025-03-01', '2025-12-31', None, '2025-01-01'])})
+    stats = local_backend.mrp_summary_stats(mrp_df.reindex(columns=['PartNum'] + [f"c{idx}" for idx in range(2, c.due_date_idx)] + ['Due Date']))
+    assert local_backend.mrp_summary_names(stats) == {c.MRP_SUMMARY_NAMES['parts']: '2', c.MRP_SUMMARY_NAMES['up_till']: '"Data shown up till Dec 2025"'}
+
+def letter_frame(width, **columns):
+    """
+    Builds a sheet frame with columns A..width, filled from the given column letters (other columns blank).
+    """
+    rows = len(next(iter(columns.values())))
+    letters = [get_column_letter(idx) for idx in range(1, column_index_from_string(width) + 1)]
+    return pd.DataFrame({letter: columns.get(letter, [None] * rows) for letter in letters})
+
+def summary_frames():
+    return {
+        'MO': letter_frame('O', A=['P1', 'p1', 'P2', 'P3', None], L=['Job: MRP Planned', 'Job: Start', 'job: mrp firm', 'Job: Start', 'Job: Start'],
+                           N=['5', 3, 'x', 2, 7], O=[1, 1, 1, 1, 1]),
+        'PO': letter_frame('O', A=['P1', 'P2'], N=[1, 2]),
+        'SO': letter_frame('O', A=['P1', 'P9'], O=[4, 10]),
+        'Forecast': letter_frame('O', A=['p2'], O=[1]),
+        'Suggestion': letter_frame('O', A=['P1', 'P9'], N=[0, 6]),
+    }
+
+def test_sumifs_totals_matches_sumifs_criteria():
+    mo_df = summary_frames()['MO']
+    # Keys compare case-insensitively, text amounts count as 0, rows without a key are left out
+    pd.testing.assert_series_equal(aggregation.sumifs_totals(mo_df, 'N', criteria_col='L', criteria='<>Job: MRP*'),
+                                   pd.Series({'p1': 3.0, 'p2': 0.0, 'p3': 2.0}), check_names=False)
+    pd.testing.assert_series_equal(aggregation.sumifs_totals(mo_df, 'N', criteria_col='L', criteria='=Job: MRP*'),
+                                   pd.Series({'p1': 5.0, 'p2': 0.0, 'p3': 0.0}), check_names=False)
+
+def test_summary_values_match_the_summary_formulas():
+    ohs_df = letter_frame('P', A=['P1', 'P2', 'P9'], P=[10, '4', None])
+
+    values = aggregation.compute_summary_values(ohs_df, summary_frames())
+
+    #  columns:   I  J   K  L  M   N   O  P  Q  R   T  U    V     W     X      Y
+    expected = pd.DataFrame([
+        [3, 1, 4, 0, 1, 9, 13, 5, 1, 0, 6, 11, 5, True, None, False],
+        [0, 2, 0, 1, 0, 5, 4, 0, 1, 0, 2, 6, 4, True, None, False],
+        [0, 0, 10, 0, 0, -10, -4, 0, 0, 6, 10, 0, -10, 0, True, False],
+    ], columns=[9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 20, 21, 22, 23, 24, 25])
+    pd.testing.assert_frame_equal(values, expected, check_dtype=False)
+
+def test_inventory_area_mapped_like_the_pasted_vlookup():
+    area_ws = Workbook().active
+    for row in [('Warehouse', 'Area'), ('WH1', 'North'), ('wh1', 'South'), (' Wh2 ', 'South'), ('WH3', None), (None, 'West')]:
+        area_ws.append(row)
+    inventory_df = letter_frame('E', A=['P1', 'P2', 'P3', 'P4', 'P5', 'P6'], E=['wh1', 'WH2', 'wh3', 'WH9', None, ''])
+
+    mapped = map_inventory_area(inventory_df, area_ws)
+
+    # First match wins and case is folded, a blank Area gives 0, a missing warehouse '#N/A', a blank warehouse stays blank
+    expected = inventory_df.copy()
+    expected.insert(5, 'Area', pd.Series(['North', 'South', 0, '#N/A', float('nan'), float('nan')], dtype=object))
+    pd.testing.assert_frame_equal(mapped, expected)
+
+def test_tpr_area_values_match_the_vlookup_formulas():
+    inventory_df = pd.DataFrame({
+        'Part Num': ['P1', 'p1', 'P1', 'P2', 'P2', 'P3', 'P4', 'P4'],
+        'Area': ['North', 'South', 0, 'North', '#N/A', None, 'East', 'West'],
+        'On Hand': [5, 2, 100, '3', 50, 7, 1, 4],
+    })
+    tpr_df = letter_frame('K', A=['P1', 'P2', 'P3', 'P4', 'P9'], K=[7, '3', None, 'abc', 0])
+
+    labels, values = aggregation.compute_tpr_area_values(tpr_df, inventory_df)
+
+    # Hidden Areas (0, #N/A, blank) are left out of the pivot, blank quantities compare as 0 and text never matches
+    assert labels == ['East', 'North', 'South', 'West']
+    #  columns:    Q  R  S  T  U      V   W      X
+    expected = pd.DataFrame([
+        [0, 5, 2, 0, 7, True, 14, False],
+        [0, 3, 0, 0, 3, True, 6, False],
+        [0, 0, 0, 0, 0, True, 0, True],
+        [1, 0, 0, 4, 5, False, 10, False],
+        [0, 0, 0, 0, 0, True, 0, True],
+    ], columns=[17, 18, 19, 20, 21, 22, 23, 24])
+    pd.testing.assert_frame_equal(values, expected, check_dtype=False)
+
+def test_chunk_contributions_merge_into_the_whole_frame_totals():
+    source_df = pd.DataFrame({
+        'Part': ['P1', 'P2', 'P1', 'P1', 'P3', 'P2'],
+        'Area': ['North', None, 'North', 'North', 'East', ''],
+        'On Hand': [5, 3, 2, 4, '1', 'x'],
+    })
+    fields = (['Part'], ['Area'], [('On Hand', 'sum'), ('Part', 'count')])
+    parts = [local_backend.pivot_contributions(source_df.iloc[:3], *fields), local_backend.pivot_contributions(source_df.iloc[3:], *fields)]
+
+    merged = local_backend.merge_contributions(parts)
+
+    expected = pd.DataFrame(
+        {'Sum of On Hand': [11, 3, 1], 'Count of Part': [3, 2, 1]},
+        index=pd.MultiIndex.from_tuples([('P1', 'North'), ('P2', '(blank)'), ('P3', 'East')], names=['Part', 'Area']),
+    )
+    pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(merged, local_backend.pivot_contributions(source_df, *fields), check_dtype=False)
+
+def test_chunk_summary_totals_add_up_to_the_whole_frame_totals():
+    frames = summary_frames()
+    first = {name: df.iloc[:1] for name, df in frames.items()}
+    rest = {name: df.iloc[1:] for name, df in frames.items()}
+
+    totals = aggregation.summary_totals(rest, aggregation.summary_totals(first))
+
+    assert totals[9].to_dict() == {'p1': 3.0, 'p2': 0.0, 'p3': 2.0}
+    assert totals[16].to_dict() == {'p1': 5.0, 'p2': 0.0, 'p3': 0.0}
+    assert totals[11].to_dict() == {'p1': 4.0, 'p9': 10.0}
+
+def test_year_month_from_the_due_dates():
+    schedule_df = letter_frame('J', J=[datetime(2025, 3, 1), '2024-12-31', None, 'not a date', pd.Timestamp('2030-12-31')]).set_index(pd.Index([7, 3, 9, 1, 4]))
+
+    year_month = year_month_frame(schedule_df)
+
+    expected = pd.DataFrame({'Year': pd.Series([2025, 2024, None, None, 2030], dtype=object), 'Month': ['Mar', 'Dec', None, None, 'Dec']})
+    pd.testing.assert_frame_equal(year_month, expected)
@@ -0,0 +1,115 @@
+import pandas as pd
+import pytest
+
+import constants as c
+import report_writer
+from filtering import SOURCE_BITS
+from filtering import classify_source
+from filtering import has_source_flag
+from filtering import partition_frame
+from helper import add_schedule_flags
+from helper import convert_to_numeric
+from helper import schedule_flag_frame
+from openpyxl import Workbook
+from openpyxl import load_workbook
+from worksheet_manager import format_due_date
+from worksheet_manager import write_frame_to_sheet
+
+def schedule_frame(columns):
+    source = pd.Series(['Job: MRP Planned Order', 'Job: Job Start', 'Suggestion: Expedite', 'Suggestion: Postpone', 'Forecast'])
+    df = pd.DataFrame({f"col{idx}": range(len(source)) for idx in range(1, columns + 1)}).assign(Source=source)
+    return df.assign(**{c.SOURCE_FLAGS_COLUMN: classify_source(source)})
+
+@pytest.mark.parametrize('columns', [15, 22])
+def test_flag_columns_follow_the_frame_in_both_paths(columns):
+    schedule_df = schedule_frame(columns)
+    flagged = add_schedule_flags(schedule_df).drop(columns=[c.SOURCE_FLAGS_COLUMN])
+    streamed = report_writer.extend_frame(schedule_df, schedule_flag_frame(schedule_df))
+
+    assert list(flagged.columns[-len(c.COLUMNS_TO_ADD_SCHEDULE):]) == c.COLUMNS_TO_ADD_SCHEDULE
+    assert flagged.shape == streamed.shape
+    assert flagged.astype(object).where(flagged.notna(), None).values.tolist() == streamed.astype(object).where(streamed.notna(), None).values.tolist()
+    assert flagged['MRP'].notna().tolist() == [True, False, False, False, False]
+    assert flagged['MO'].notna().tolist() == [False, True, False, False, False]
+
+def test_extend_frame_rejects_columns_inside_the_frame():
+    schedule_df = schedule_frame(15)
+    with pytest.raises(ValueError):
+        report_writer.extend_frame(schedule_df, pd.DataFrame({16: [None] * len(schedule_df)}))
+
+def test_write_only_date_column_matches_format_due_date(tmp_path):
+    # Inventory by WH is narrower than the due date column: format_due_date still formats every J cell below the header
+    inventory_df = pd.DataFrame({f"col{idx}": [idx, None, idx] for idx in range(1, 10)})
+    standard_wb = Workbook()
+    write_frame_to_sheet(standard_wb, inventory_df, 'Inventory by WH')
+    format_due_date(standard_wb, c.due_date_idx)
+
+    path = str(tmp_path / 'write_only.xlsx')
+    report_writer.write_only_workbook(path, [{'name': 'Inventory by WH', 'df': inventory_df, 'date_col': c.due_date_idx}])
+    streamed_ws = load_workbook(path)['Inventory by WH']
+    standard_ws = standard_wb['Inventory by WH']
+
+    assert [streamed_ws.cell(row, c.due_date_idx).number_format for row in range(2, 5)] == ['DD/MM/YYYY'] * 3
+    assert [standard_ws.cell(row, c.due_date_idx).number_format for row in range(2, 5)] == ['DD/MM/YYYY'] * 3
+
+def partition_config():
+    yield {'name': 'MRP', 'filters': [lambda df: df['Source'].str.contains('MRP', na=False)]}
+    yield {'name': 'Open', 'filters': [lambda df: df['Qty'] > 0, lambda df: df['Class'] == 'A']}
+    yield {'name': 'Big', 'filters': lambda df: [lambda frame: frame['Qty'] >= df['Qty'].max()]} # callable returning the filters
+    yield {'name': 'None', 'filters': [lambda df: df['Qty'] > 100]}
+
+def test_partition_frame_routes_rows_to_every_matching_sheet():
+    df = pd.DataFrame({
+        'Source': ['Job: MRP Planned Order', 'SO: 1', None, 'Job: MRP Firm', 'PO: 7'],
+        'Qty': [5, 0, 9, 9, pd.NA],
+        'Class': ['A', 'A', 'A', 'B', 'A'],
+    }, index=[10, 11, 12, 13, 14])
+
+    partitions = partition_frame(df, partition_config)
+
+    assert list(partitions) == ['MRP', 'Open', 'Big', 'None']
+    pd.testing.assert_frame_equal(partitions['MRP'], df.loc[[10, 13]])
+    pd.testing.assert_frame_equal(partitions['Open'], df.loc[[10, 12]]) # NA quantity never matches
+    pd.testing.assert_frame_equal(partitions['Big'], df.loc[[12, 13]]) # rows routed to several sheets
+    pd.testing.assert_frame_equal(partitions['None'], df.iloc[[]])
+
+def test_classify_source_flags():
+    source = pd.Series(['Job: MRP Planned Order', 'job: mrp firm', 'Suggestion: Expedite', None, 'On-hand Quantity', 'SO: 12', 'Forecast', 'Job: MRP Planned Order'])
+    bits = SOURCE_BITS
+
+    flags = classify_source(source)
+
+    assert flags.tolist() == [
+        bits['MRP'] | bits['Job'] | bits['Job Start'],
+        bits['MRP'] | bits['Job'], # 'contains' ignores case, 'startswith' does not
+        bits['Suggestion'] | bits['Expedite'],
+        0,
+        bits['On-hand'] | bits['On-hand Quantity'],
+        bits['SO'],
+        bits['Forecast'],
+        bits['MRP'] | bits['Job'] | bits['Job Start'],
+    ]
+    df = pd.DataFrame({'Source': source, c.SOURCE_FLAGS_COLUMN: flags})
+    assert has_source_flag(df, 'Job Start').tolist() == [True, False, False, False, False, False, False, True]
+
+def test_convert_to_numeric_reports_failed_values():
+    df = pd.DataFrame({
+        'PartNum': ['001', '002', '003', '004'],
+        'Qty': ['1,200', ' 5 ', '', None],
+        'Ref': ['12', 'abc', None, '3'],
+        'Typed': [1, 2, 3, 4],
+        c.SOURCE_FLAGS_COLUMN: [1, 0, 0, 2],
+    }, index=[5, 6, 7, 8])
+
+    converted, partitions, report = convert_to_numeric(df, {'first': df.loc[[5, 6]]})
+
+    expected = pd.DataFrame({
+        'PartNum': ['001', '002', '003', '004'],
+        'Qty': [1200.0, 5.0, None, None],
+        'Ref': pd.Series([12.0, 'abc', float('nan'), 3.0], index=[5, 6, 7, 8], dtype=object), # a column with failures keeps them as text
+        'Typed': [1, 2, 3, 4],
+        c.SOURCE_FLAGS_COLUMN: [1, 0, 0, 2],
+    }, index=[5, 6, 7, 8])
+    assert report == {'Qty': 0, 'Ref': 1}
+    pd.testing.assert_frame_equal(converted, expected)
+    pd.testing.assert_frame_equal(partitions['first'], expected.loc[[5, 6]])
@@ -0,0 +1,30 @@
+import constants as c
+import run_trace
+from run_trace import stage
+from run_trace import traced_run
+
+def test_no_records_without_run_report(monkeypatch):
+    monkeypatch.setattr(c, 'RUN_REPORT', False)
+    run_trace.take_records()
+    for _ in range(3): # e.g. snapshots of the in-process watcher
+        with traced_run('TPR'):
+            with stage('csv parse') as record:
+                record['rows_out'] = 10
+    assert run_trace.take_records() == []
+
+def test_worker_figures_added_to_the_total():
+    stages = [
+        {'stage': 'report builds', 'cpu_s': 0.02, 'peak_rss_mb': 80.0},
+        {'stage': 'worker build', 'report': 'TPR', 'cpu_s': 3.5, 'peak_rss_mb': 400.0},
+        {'stage': 'worker build', 'report': 'Summary', 'cpu_s': 2.5, 'peak_rss_mb': 300.0},
+        {'stage': 'total', 'cpu_s': 0.08, 'peak_rss_mb': 90.0},
+    ]
+    run_trace.add_worker_totals(stages)
+    total = stages[-1]
+    assert (total['cpu_s'], total['peak_rss_mb'], total['workers']) == (6.08, 790.0, 2)
+    assert (total['parent_cpu_s'], total['parent_peak_rss_mb']) == (0.08, 90.0)
+
+def test_total_of_a_single_process_run_unchanged():
+    stages = [{'stage': 'csv parse', 'cpu_s': 1.0, 'peak_rss_mb': 200.0}, {'stage': 'total', 'cpu_s': 1.5, 'peak_rss_mb': 210.0}]
+    run_trace.add_worker_totals(stages)
+    assert stages[-1] == {'stage': 'total', 'cpu_s': 1.5, 'peak_rss_mb': 210.0}
@@ -0,0 +1,63 @@
+import inspect
+import os
+
+import pytest
+
+import constants as c
+import stage_cache
+from aggregation import sumifs_totals
+from file_handler import convert_csv_types
+from file_handler import load_source
+from file_handler import source_stage_key
+from file_handler import widen_floats
+from filtering import has_source_flag
+from helper import convert_to_numeric
+from local_backend import item_sort_key
+from stage_cache import cached_stage
+from stage_cache import stage_key
+
+@pytest.fixture
+def stage_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(c, 'STAGE_CACHE', True)
+    monkeypatch.setattr(c, 'STAGE_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+def test_failed_csv_parse_is_not_cached(stage_cache_dir, tmp_path, monkeypatch):
+    source_file = tmp_path / 'export.csv'
+    source_file.write_text('not,a\nvalid export\n')
+    monkeypatch.setattr(c, 'source_file', str(source_file))
+    columns = c.CSV_SCHEMAS['TPR']['columns']
+    key = source_stage_key(columns)
+
+    for _ in range(2): # the rerun parses again instead of replaying the failure
+        with pytest.raises(RuntimeError):
+            cached_stage('csv', key, lambda: load_source(columns))
+    assert not stage_cache_dir.exists() or not os.listdir(stage_cache_dir)
+
+def test_none_result_is_not_cached(stage_cache_dir):
+    calls = []
+    for _ in range(2):
+        assert cached_stage('stage', 'key', lambda: calls.append(1)) is None
+    assert len(calls) == 2
+
+def test_result_is_cached(stage_cache_dir):
+    calls = []
+    for _ in range(2):
+        assert cached_stage('stage', 'key', lambda: calls.append(1) or {'rows': 3}) == {'rows': 3}
+    assert len(calls) == 1
+
+def test_helper_edit_invalidates_the_stage(tmp_path, monkeypatch):
+    module_file = tmp_path / 'stage_helpers.py'
+    module_file.write_text("def is_mrp(source):\n    return source.startswith('Job: MRP')\n\ndef mrp_rows(df):\n    return df[df['Source'].map(is_mrp)]\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(stage_cache, 'PIPELINE_MODULES', ['stage_helpers'])
+    key = stage_key('frames', stage_cache.pipeline_modules())
+
+    # only the helper called by the stage's entry point changes
+    module_file.write_text(module_file.read_text().replace("'Job: MRP'", "'MRP'"))
+    assert stage_key('frames', stage_cache.pipeline_modules()) != key
+
+def test_pipeline_modules_hold_the_stage_helpers():
+    modules = stage_cache.pipeline_modules()
+    for function in (has_source_flag, convert_to_numeric, widen_floats, convert_csv_types, sumifs_totals, item_sort_key):
+        assert inspect.getmodule(function) in modules
@@ -1,66 +1,97 @@
 import constants as c
-import datetime
 from copy import copy
 from openpyxl.utils import column_index_from_string
 from openpyxl.styles import Font
 from openpyxl.styles import PatternFill
-from file_handler import load_excel_workbook
+from filtering import classify_source
+from file_handler import widen_floats
 
-def prepare_working_sheet(wb, header_wb, new_sheet_name, header_sheet_name, cols_to_delete, source_sheet_name = "Sheet1" ):
+def kept_column_positions(n_cols, cols_to_delete):
     """
-    Takes an openpyxl Workbook object, copies a sheet, hides the original,
-    renames the copy, and adds a styled header from another workbook.
+    Returns the 0-based positions of the columns that survive cols_to_delete (e.g. COLUMNS_TO_DELETE_MRP).
+    """
+    deleted = {column_index_from_string(col) - 1 for col in cols_to_delete}
+    return [idx for idx in range(n_cols) if idx not in deleted]
+
+def drop_frame_columns(df, cols_to_delete):
+    """
+    Drops columns of a sheet frame by column letter, so the sheet is written without them (no delete_cols).
+    """
+    return df.iloc[:, kept_column_positions(len(df.columns), cols_to_delete)]
+
+def header_template_cells(header_ws, columns):
+    """
+    Returns the header cells of the header sheet for the schema columns (CSV_SCHEMAS).
+    """
+    return [header_ws[f'{col}1'] for col in columns if column_index_from_string(col) <= header_ws.max_column]
+
+def prepare_working_frame(df, header_ws, columns):
+    """
+    Builds the Working frame from the parsed csv: the schema columns are renamed with the header row of the header sheet.
 
     Parameters:
-    - wb (Workbook): Already loaded main workbook.
-    - header_wb (Workbook): Already loaded header workbook.
-    - source_sheet_name (str): Name of the sheet to copy.
-    - new_sheet_name (str): Desired name for the copied sheet.
+    - df (DataFrame): Csv export read with the schema columns (load_csv(path, columns)), optionally followed by the Source flags.
+    - header_ws (Worksheet): Header sheet from the header workbook ('Header' or 'SummaryHeader').
+    - columns (list): Column letters of the export kept for the report (CSV_SCHEMAS).
 
     Returns:
-    - Workbook: Modified workbook object.
+    - DataFrame: Working frame.
+    """
+    headers = [cell.value for cell in header_template_cells(header_ws, columns)]
+    working_df = df.set_axis([
+        headers[idx] if idx < len(headers) and headers[idx] not in (None, '') else name
+        for idx, name in enumerate(df.columns)
+    ], axis=1)
+    print("Working columns named from the header sheet.")
+
+    # Classify the Source column once, every filter and flag fill reads from these flags
+    if c.SOURCE_FLAGS_COLUMN in working_df.columns:
+        return working_df # already classified on the shared csv frame (main_all.py)
+    return working_df.assign(**{c.SOURCE_FLAGS_COLUMN: classify_source(working_df['Source'])})
+
+def prepare_working_sheet(wb, header_wb, new_sheet_name, header_sheet_name, columns, working_df):
     """
-    # Copy and rename the sheet
-    source_ws = wb[source_sheet_name]
-    working_ws = wb.copy_worksheet(source_ws)
-    working_ws.title = new_sheet_name
+    Writes the Working frame into a new sheet and styles its header with the
+    header row from another workbook.
 
-    # Hide the original sheet 
-    source_ws.sheet_state = 'hidden'
+    Parameters:
+    - wb (Workbook): Main workbook being built.
+    - header_wb (Workbook): Already loaded header workbook.
+    - new_sheet_name (str): Desired name for the working sheet.
+    - header_sheet_name (str): Name of the header sheet in header_wb.
+    - columns (list): Column letters of the export kept for the report (CSV_SCHEMAS).
+    - working_df (DataFrame): Frame returned by prepare_working_frame.
 
-    # Get the header row from the header workbook
+    Returns:
+    - Workbook: Modified workbook object.
+    """
     header_ws = header_wb[header_sheet_name]
-    working_ws.insert_rows(2)
+    working_ws = write_frame_to_sheet(wb, working_df, new_sheet_name)
 
-    # Copy the header style from TPR Header 
-    copy_header_styles(header_ws,wb,header_row = 2)
+    # Copy the header style from TPR Header, following the columns that were kept
+    for col_index, header_cell in enumerate(header_template_cells(header_ws, columns), start=1):
+        style_header_cell(working_ws.cell(row=1, column=col_index), header_cell)
     print(f"'{new_sheet_name}' sheet has been created with header.")
 
-    remove_unwanted_columns(working_ws,cols_to_delete)
-
-    # Adjust width of column to max length
-    adjust_column_width(wb)
     return wb
 
-def remove_unwanted_columns(ws, cols_to_delete):
+def write_frame_to_sheet(wb, df, sheet_name, index=None, hidden=False):
     """
-    Removes unwanted columns from the worksheet based on COLUMNS_TO_DELETE.
-    Deletion is done from right to left to avoid shifting.
+    Writes a DataFrame (header + rows) into a new sheet, replacing any sheet with the same name.
+    Missing values are written as empty cells and internal columns are left out.
     """
-    # Convert letters to indices, remove duplicates, and sort descending
-    cols_to_remove = sorted(
-        {column_index_from_string(col) for col in cols_to_delete},
-        reverse=True
-    )
+    df = widen_floats(df.drop(columns=[c.SOURCE_FLAGS_COLUMN], errors='ignore'))
+    if sheet_name in wb.sheetnames:
+        del wb[sheet_name]
 
-    for col_idx in cols_to_remove:
-        ws.delete_cols(col_idx)
+    ws = wb.create_sheet(title=sheet_name, index=index)
+    ws.append(list(df.columns))
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        ws.append(row)
 
-    print("Selected columns removed.")
-
-    if ws.title == 'Working' or ws.title == "TPR Working":
-        ws.delete_rows(1) # Remove first row from working sheets 
-        print("Top row removed from working sheet.")
+    if hidden:
+        ws.sheet_state = 'hidden'
+    return ws
 
 def adjust_column_width(wb):
     # Make sure all values are visible --> adjust width of column to max length and freeze top row
@@ -88,32 +119,48 @@ def adjust_column_width(wb):
 def copy_header_styles(styled_ws, wb,header_row):
     """
     Copies the header styles from the styled_ws (reference) to all sheets in the workbook (wb).
+    Headers are matched by name, so sheets written with fewer columns (MRP) keep their own layout.
     
     Parameters:
     - styled_ws: The worksheet containing the reference header styles
     - wb: The workbook containing the sheets to apply the header style to
     """
+    reference_cells = {cell.value: cell for cell in styled_ws[1]}
     for sheet_name in wb.sheetnames:
-        green_fill = PatternFill(start_color="A9D08E", end_color="A9D08E", fill_type="solid")
         # Skip the sheet named 'Sheet1' and 'Inventory by WH'
         if sheet_name in ['Sheet1','Inventory by WH','Summary']:
             continue
 
         sheet = wb[sheet_name]  # Access each sheet by name
 
-        # Only apply the style to the first row (header)
-        for col_index, value in enumerate(styled_ws[1], start=1):
+        # Only apply the style to the first row (header), within the width of the reference header
+        for col_index in range(1, len(styled_ws[1]) + 1):
             target_cell = sheet.cell(row=header_row, column=col_index)
-            target_cell.value = value.value
-            target_cell.fill = green_fill           
-            target_cell.font = Font(bold=True)
+            if target_cell.value is not None and target_cell.value in reference_cells:
+                style_header_cell(target_cell, reference_cells[target_cell.value])
 
-            # Copy styles from reference header
-            if value.has_style:
-                target_cell.border = copy(value.border)
-                target_cell.alignment = copy(value.alignment)
-                target_cell.number_format = value.number_format
-                target_cell.protection = copy(value.protection)
+def style_header_cell(target_cell, value):
+    """
+    Writes a header value with the green/bold header look, copying the remaining styles from the reference cell.
+    """
+    green_fill = PatternFill(start_color="A9D08E", end_color="A9D08E", fill_type="solid")
+    target_cell.value = value.value
+    target_cell.fill = green_fill
+    target_cell.font = Font(bold=True)
+
+    # Copy styles from reference header
+    if value.has_style:
+        target_cell.border = copy(value.border)
+        target_cell.alignment = copy(value.alignment)
+        target_cell.number_format = value.number_format
+        target_cell.protection = copy(value.protection)
+
+def bold_header_cells(ws, headers):
+    # Bold the header cells of columns written with the sheet frame (Schedule flag columns)
+    bold_font = Font(bold=True)
+    for cell in ws[1]:
+        if cell.value in headers:
+            cell.font = bold_font
 
 def create_new_columns(ws, new_headers, after_col_letter = None):
     for col in range(ws.max_column, 0, -1):
@@ -140,58 +187,12 @@ def create_new_columns(ws, new_headers, after_col_letter = None):
         if ws.title == 'Schedule' or ws.title == 'Summary':
             cell.font = bold_font  # Apply bold font
 
-def add_year_month_columns(ws, due_date_col=c.due_date_idx):
+def import_inventory_sheet(inventory_df, target_wb, source_sheet_name = 'Results', new_sheet_name='Inventory by WH', before_sheet_name = 'MRP'):
     """
-    Adds Year and Month columns based on the Due Date at the end of the existing columns.
-    Populates Year and Month values.
+    Writes the QOH frame (Area column already mapped) into the target workbook and puts it before 'MRP'.
     """
-    # Find last row with data in the due date column
-    last_row = ws.Cells(ws.Rows.Count, due_date_col).End(-4162).Row  # xlUp = -4162
-
-    # Find last used column in the first row
-    last_col = ws.Cells(1, ws.Columns.Count).End(-4159).Column  # xlToLeft = -4159
-
-    # Decide where to insert the Year and Month
-    year_col = last_col + 1
-    month_col = last_col + 2
-
-    # Set headers
-    ws.Cells(1, year_col).Value = "Year"
-    ws.Cells(1, month_col).Value = "Month"
-
-    # Fill values
-    for i in range(2, last_row + 1):
-        due_date = ws.Cells(i, due_date_col).Value
-        if isinstance(due_date, datetime.datetime):
-            ws.Cells(i, year_col).Value = due_date.year
-            ws.Cells(i, month_col).Value = due_date.strftime("%b")
-        else:
-            ws.Cells(i, year_col).Value = None
-            ws.Cells(i, month_col).Value = None
-
-    print(f"Year and Month columns added to the Schedule sheet at columns {year_col} and {month_col}.")
-
-
-def import_inventory_sheet(source_file_path, target_wb, source_sheet_name = 'Results', new_sheet_name='Inventory by WH', before_sheet_name = 'MRP'):
-    # Load the source workbook and sheet
-    src_wb = load_excel_workbook(source_file_path)
-    src_ws = src_wb[source_sheet_name]
-
-    # Create a new sheet in the target workbook
-    target_ws = target_wb.create_sheet(title=new_sheet_name)
-
-    # Copy content from source to target
-    for row in src_ws.iter_rows():
-        for cell in row:
-            target_ws.cell(row=cell.row, column=cell.column).value = cell.value
-
-    # Reorder sheets to put new sheet before 'MRP'
-    sheets = target_wb._sheets
-    mrp_index = sheets.index(target_wb[before_sheet_name])
-    new_sheet_index = sheets.index(target_ws)
-
-    # Remove and insert in the correct position
-    sheets.insert(mrp_index, sheets.pop(new_sheet_index))
+    # Create the new sheet before 'MRP'
+    write_frame_to_sheet(target_wb, inventory_df, new_sheet_name, index=target_wb.sheetnames.index(before_sheet_name))
 
     print(f"{source_sheet_name} copied to target workbook as {new_sheet_name} and {new_sheet_name} inserted before {before_sheet_name}.")
 